@@ -0,0 +1,354 @@
+"""
+Подставной Discord REST для нагрузочных прогонов без сети.
+
+FakeSession подменяет aiohttp-сессию клиента (и HTTPClient, и вебхуки
+взаимодействий ходят через неё), поэтому весь путь discord.py — разбор
+заголовков лимитов, ожидание бакетов, повтор после 429 — работает как в бою.
+Сервер имитирует задержку, бакеты по каналам/токенам, глобальный лимит
+и случайные 429, а заодно считает всё, что к нему пришло.
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from multidict import CIMultiDict
+
+DISCORD_EPOCH = 1420070400000
+
+# (лимит, окно в секундах) — порядок величин как у настоящего Discord
+CHANNEL_LIMIT = (5, 5.0)
+WEBHOOK_LIMIT = (5, 2.0)
+DM_OPEN_LIMIT = (10, 10.0)
+GLOBAL_LIMIT = (50, 1.0)
+
+ROUTES = [
+    ("POST", r"/interactions/(?P<iid>\d+)/(?P<token>[^/]+)/callback", "callback"),
+    ("GET", r"/webhooks/\d+/(?P<token>[^/]+)/messages/@original", "original_get"),
+    ("PATCH", r"/webhooks/\d+/(?P<token>[^/]+)/messages/@original", "original_edit"),
+    ("PATCH", r"/webhooks/\d+/(?P<token>[^/]+)/messages/(?P<mid>\d+)", "followup_edit"),
+    ("POST", r"/webhooks/\d+/(?P<token>[^/]+)", "followup"),
+    ("POST", r"/channels/(?P<cid>\d+)/messages", "message_create"),
+    ("POST", r"/channels/(?P<cid>\d+)/messages/bulk-delete", "message_bulk_delete"),
+    ("PATCH", r"/channels/(?P<cid>\d+)/messages/(?P<mid>\d+)", "message_edit"),
+    ("DELETE", r"/channels/(?P<cid>\d+)/messages/(?P<mid>\d+)", "message_delete"),
+    ("PUT", r"/channels/(?P<cid>\d+)/(?:messages/)?pins/(?P<mid>\d+)", "pin"),
+    ("POST", r"/users/@me/channels", "dm_open"),
+    ("PUT", r"/applications/\d+/(?:guilds/\d+/)?commands", "commands_sync"),
+]
+ROUTES = [(m, re.compile(p + r"$"), name) for m, p, name in ROUTES]
+
+
+def iso_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeResponse:
+    def __init__(self, status: int, data=None, headers: dict | None = None):
+        self.status = status
+        self.reason = {200: "OK", 204: "No Content", 404: "Not Found", 429: "Too Many Requests"}.get(status, "")
+        self._body = "" if data is None else json.dumps(data)
+        self.headers = CIMultiDict(headers or {})
+        if data is not None:
+            self.headers["content-type"] = "application/json"
+
+    async def text(self, encoding: str = "utf-8") -> str:
+        return self._body
+
+    async def read(self) -> bytes:
+        return self._body.encode()
+
+
+class _Call:
+    def __init__(self, server: "FakeDiscord", method: str, url: str, kwargs: dict):
+        self.server = server
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+
+    async def __aenter__(self) -> FakeResponse:
+        return await self.server.handle(self.method, self.url, self.kwargs)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    closed = False
+
+    def __init__(self, server: "FakeDiscord"):
+        self.server = server
+
+    def request(self, method: str, url: str, **kwargs) -> _Call:
+        return _Call(self.server, method, url, kwargs)
+
+    async def close(self):
+        self.closed = True
+
+
+class _Bucket:
+    __slots__ = ("limit", "per", "remaining", "reset_at")
+
+    def __init__(self, limit: int, per: float):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def hit(self, now: float) -> bool:
+        # фиксированное окно, как у Discord: отсчёт от первого запроса
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.per
+        if self.remaining == 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+class FakeDiscord:
+    """
+    Состояние подставного сервера: сообщения, ответы на взаимодействия,
+    открытые модалки и счётчики запросов.
+    """
+
+    def __init__(
+        self,
+        application_id: int,
+        latency: float = 0.05,
+        jitter: float = 0.5,
+        chaos_429: float = 0.0,
+        seed: int = 0,
+    ):
+        self.application_id = application_id
+        self.latency = latency
+        self.jitter = jitter
+        self.chaos_429 = chaos_429
+        self.rng = random.Random(seed)
+
+        self._seq = itertools.count()
+        self._buckets: dict[tuple, _Bucket] = {}
+        self._global = _Bucket(*GLOBAL_LIMIT)
+
+        self.messages: dict[int, dict] = {}
+        self.originals: dict[str, int] = {}
+        self.interactions: dict[int, dict] = {}
+        self.modals: dict[int, dict] = {}
+        self.acked_at: dict[int, float] = {}
+
+        self.calls = Counter()
+        self.rate_limited = Counter()
+        self.unknown = Counter()
+        self.started_at = time.monotonic()
+
+    # ====== служебное ======
+    def snowflake(self) -> int:
+        ms = int(time.time() * 1000) - DISCORD_EPOCH
+        return (ms << 22) | (next(self._seq) & 0x3FFFFF)
+
+    def bot_user(self) -> dict:
+        return {
+            "id": str(self.application_id), "username": "strela-bench",
+            "discriminator": "0", "avatar": None, "bot": True,
+        }
+
+    def register_interaction(self, interaction_id: int, channel_id: int, message_id: int | None = None):
+        # что знает Discord о взаимодействии: канал и (для кнопок) сообщение
+        self.interactions[interaction_id] = {
+            "channel_id": channel_id, "message_id": message_id, "sent_at": time.monotonic(),
+        }
+
+    def _message(self, channel_id: int, body: dict) -> dict:
+        mid = self.snowflake()
+        msg = {
+            "id": str(mid), "channel_id": str(channel_id), "type": 0,
+            "content": body.get("content", ""), "author": self.bot_user(),
+            "attachments": [], "embeds": body.get("embeds", []),
+            "components": body.get("components", []),
+            "mentions": [], "mention_roles": [], "mention_everyone": False,
+            "pinned": False, "tts": False, "flags": body.get("flags", 0),
+            "timestamp": iso_now(), "edited_timestamp": None,
+        }
+        if "message_reference" in body:
+            msg["type"] = 19
+            msg["message_reference"] = body["message_reference"]
+        self.messages[mid] = msg
+        return msg
+
+    def _edit(self, mid: int, body: dict) -> dict | None:
+        msg = self.messages.get(mid)
+        if msg is None:
+            return None
+        for key in ("content", "embeds", "components", "flags"):
+            if key in body:
+                msg[key] = body[key]
+        msg["edited_timestamp"] = iso_now()
+        return msg
+
+    def _bucket_for(self, name: str, params: dict) -> tuple[tuple, tuple[int, float]] | None:
+        if name in ("message_create", "message_edit", "message_delete", "message_bulk_delete", "pin"):
+            return ("channel", params["cid"]), CHANNEL_LIMIT
+        if name in ("followup", "original_get", "original_edit", "followup_edit"):
+            return ("webhook", params["token"]), WEBHOOK_LIMIT
+        if name == "dm_open":
+            return ("dm_open",), DM_OPEN_LIMIT
+        return None  # ответ на взаимодействие лимитом не ограничен
+
+    def _limited(self, key: tuple, retry_after: float, is_global: bool = False) -> FakeResponse:
+        headers = {
+            "Via": "1.1 google",
+            "X-RateLimit-Limit": "1", "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset-After": f"{retry_after:.3f}",
+            "X-RateLimit-Bucket": "-".join(map(str, key)),
+            "X-RateLimit-Scope": "global" if is_global else "user",
+        }
+        if is_global:
+            headers["X-RateLimit-Global"] = "true"
+        return FakeResponse(429, {"message": "You are being rate limited.", "retry_after": retry_after, "global": is_global}, headers)
+
+    # ====== обработка запроса ======
+    async def handle(self, method: str, url: str, kwargs: dict) -> FakeResponse:
+        received = time.monotonic()
+        path = url.split("/api/v10", 1)[-1].split("?", 1)[0]
+
+        for route_method, pattern, name in ROUTES:
+            m = pattern.match(path)
+            if route_method == method and m:
+                params = m.groupdict()
+                break
+        else:
+            self.unknown[f"{method} {path}"] += 1
+            await self._sleep()
+            return FakeResponse(404, {"message": "Unknown route", "code": 0})
+
+        self.calls[name] += 1
+
+        if name == "callback":
+            # момент, когда "Discord" получил ответ на взаимодействие — по нему меряем ack
+            self.acked_at.setdefault(int(params["iid"]), received)
+
+        headers = {}
+        bucket_spec = self._bucket_for(name, params)
+        if bucket_spec is not None:
+            key, (limit, per) = bucket_spec
+            if not self._global.hit(received):
+                self.rate_limited["global"] += 1
+                await self._sleep()
+                return self._limited(("global",), max(self._global.reset_at - received, 0.01), is_global=True)
+
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = _Bucket(limit, per)
+            if not bucket.hit(received) or self.rng.random() < self.chaos_429:
+                self.rate_limited[name] += 1
+                await self._sleep()
+                return self._limited(key, max(bucket.reset_at - received, 0.05))
+
+            headers = {
+                "X-RateLimit-Limit": str(bucket.limit),
+                "X-RateLimit-Remaining": str(bucket.remaining),
+                "X-RateLimit-Reset-After": f"{max(bucket.reset_at - received, 0.0):.3f}",
+                "X-RateLimit-Bucket": "-".join(map(str, key[:1])),
+            }
+
+        body = kwargs.get("data")
+        body = json.loads(body) if isinstance(body, str) and body else {}
+
+        await self._sleep()
+        status, data = self._dispatch(name, params, body)
+        return FakeResponse(status, data, headers)
+
+    async def _sleep(self):
+        delay = self.latency * (1 + self.rng.uniform(-self.jitter, self.jitter))
+        await asyncio.sleep(max(delay, 0.0))
+
+    def _dispatch(self, name: str, params: dict, body: dict) -> tuple[int, object]:
+        if name == "callback":
+            return self._callback(int(params["iid"]), params["token"], body)
+
+        if name == "original_get":
+            mid = self.originals.get(params["token"])
+            return (200, self.messages[mid]) if mid else (404, {"message": "Unknown Message", "code": 10008})
+
+        if name == "original_edit":
+            mid = self.originals.get(params["token"])
+            msg = self._edit(mid, body) if mid else None
+            return (200, msg) if msg else (404, {"message": "Unknown Message", "code": 10008})
+
+        if name == "followup":
+            msg = self._message(0, body)
+            return 200, msg
+
+        if name == "followup_edit":
+            msg = self._edit(int(params["mid"]), body)
+            return (200, msg) if msg else (404, {"message": "Unknown Message", "code": 10008})
+
+        if name == "message_create":
+            return 200, self._message(int(params["cid"]), body)
+
+        if name == "message_edit":
+            msg = self._edit(int(params["mid"]), body)
+            return (200, msg) if msg else (404, {"message": "Unknown Message", "code": 10008})
+
+        if name == "message_delete":
+            self.messages.pop(int(params["mid"]), None)
+            return 204, None
+
+        if name == "message_bulk_delete":
+            for mid in body.get("messages", []):
+                self.messages.pop(int(mid), None)
+            return 204, None
+
+        if name == "pin":
+            return 204, None
+
+        if name == "dm_open":
+            return 200, {
+                "id": str(self.snowflake()), "type": 1, "last_message_id": None,
+                "recipients": [{"id": str(body.get("recipient_id")), "username": "u", "discriminator": "0", "avatar": None}],
+            }
+
+        if name == "commands_sync":
+            return 200, []
+
+        return 404, {"message": "Unknown route", "code": 0}
+
+    def _callback(self, iid: int, token: str, body: dict) -> tuple[int, object]:
+        kind = body.get("type")
+        data = body.get("data") or {}
+        info = self.interactions.get(iid, {})
+        inter = {"id": str(iid), "type": 2}
+        result = {"interaction": inter, "resource": {"type": kind}}
+
+        if kind == 4:  # CHANNEL_MESSAGE_WITH_SOURCE
+            msg = self._message(info.get("channel_id", 0), data)
+            self.originals[token] = int(msg["id"])
+            inter["response_message_id"] = msg["id"]
+            inter["response_message_ephemeral"] = bool(data.get("flags", 0) & 64)
+            result["resource"]["message"] = msg
+        elif kind == 7:  # UPDATE_MESSAGE
+            mid = info.get("message_id")
+            msg = self._edit(mid, data) if mid else None
+            if msg is None:
+                return 404, {"message": "Unknown Message", "code": 10008}
+            self.originals[token] = mid
+            inter["response_message_id"] = msg["id"]
+            result["resource"]["message"] = msg
+        elif kind == 9:  # MODAL
+            self.modals[iid] = data
+        return 200, result
+
+    # ====== сводка ======
+    def ack_latencies(self) -> dict[int, float]:
+        return {
+            iid: self.acked_at[iid] - info["sent_at"]
+            for iid, info in self.interactions.items() if iid in self.acked_at
+        }
+
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
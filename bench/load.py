@@ -0,0 +1,438 @@
+"""
+Нагрузочный прогон бота без сети: /strela, кнопки, модалка и отсчёт
+против подставного Discord из fake_discord.py.
+
+    python bench/load.py --strelas 500 --minutes 2
+    python bench/load.py --strelas 200 --chaos-429 0.02 --json out.json --max-ack-p99 2.5
+
+Отчёт: REST-запросы в минуту (по маршрутам), 429, задержка ответа на
+взаимодействия (p50/p95/p99), лаг event loop и память на активную стрелу.
+С --max-ack-p99 / --max-lag-p99 код возврата 1 при превышении — для CI.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_discord import FakeDiscord, FakeSession  # noqa: E402
+
+APP_ID = 900000000000000001
+GUILD_ID = 900000000000000002
+FACTIONS = [f"f{i}" for i in range(10)]
+SIZES = ["2x2", "3x3", "4x4", "5x5"]
+
+# доля стрел, по которым кто-то жмёт кнопки, и что именно жмут
+ACTIONS = [("accept", 0.5), ("reject", 0.3), ("reject_rollback", 0.2)]
+
+# дедлайн Discord на первый ответ
+ACK_DEADLINE = 3.0
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class LagSampler:
+    # насколько позже обещанного просыпается sleep — это и есть лаг цикла
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - t0 - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+
+class Harness:
+    def __init__(self, args, strela_bot, fake: FakeDiscord):
+        self.args = args
+        self.sb = strela_bot
+        self.bot = strela_bot.bot
+        self.state = strela_bot.bot._connection
+        self.fake = fake
+        self.rng = random.Random(args.seed)
+        self.channels = [GUILD_ID + 100 + i for i in range(args.channels)]
+        self.users: list[dict] = []
+        self.kinds: dict[int, str] = {}
+        self.created: list[int] = []
+        self.failed = 0
+
+    # ====== окружение ======
+    def guild_payload(self) -> dict:
+        roles = [{"id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "position": 0,
+                  "color": 0, "hoist": False, "managed": False, "mentionable": False}]
+        for i, tag in enumerate(FACTIONS):
+            for j, kind in enumerate(("leader", "deputy")):
+                roles.append({"id": str(self.role_id(i, j)), "name": f"{tag}-{kind}", "permissions": "0",
+                              "position": 1 + 2 * i + j, "color": 0, "hoist": False,
+                              "managed": False, "mentionable": True})
+
+        members = []
+        uid = GUILD_ID + 10_000
+        for i in range(len(FACTIONS)):
+            for j in range(2):
+                for _ in range(self.args.members_per_role):
+                    uid += 1
+                    members.append(self.member(uid, [str(self.role_id(i, j))]))
+        for _ in range(self.args.members):
+            uid += 1
+            members.append(self.member(uid, []))
+        self.users = [m for m in members if not m["roles"]] or members
+
+        channels = [{"id": str(cid), "type": 0, "name": f"strela-{n}", "position": n,
+                     "permission_overwrites": [], "nsfw": False, "parent_id": None}
+                    for n, cid in enumerate(self.channels)]
+
+        return {
+            "id": str(GUILD_ID), "name": "bench", "owner_id": str(GUILD_ID + 1),
+            "roles": roles, "members": members, "channels": channels, "threads": [],
+            "emojis": [], "stickers": [], "features": [], "member_count": len(members),
+            "large": True, "unavailable": False,
+        }
+
+    @staticmethod
+    def role_id(faction: int, kind: int) -> int:
+        return GUILD_ID + 1000 + 2 * faction + kind
+
+    @staticmethod
+    def member(uid: int, roles: list[str]) -> dict:
+        return {"user": {"id": str(uid), "username": f"user{uid}", "discriminator": "0", "avatar": None},
+                "roles": roles, "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False,
+                "flags": 0, "permissions": "0"}
+
+    async def setup(self):
+        from discord.user import ClientUser
+
+        await self.bot._async_setup_hook()
+        http = self.bot.http
+        http._HTTPClient__session = FakeSession(self.fake)
+        http.token = "bench"
+        http._global_over = asyncio.Event()
+        http._global_over.set()
+
+        self.state.user = ClientUser(state=self.state, data=self.fake.bot_user())
+        self.state.application_id = APP_ID
+        self.state._add_guild_from_data(self.guild_payload())
+        await self.bot.setup_hook()
+        await self.sb.on_ready()
+
+    # ====== взаимодействия ======
+    def interaction(self, kind: str, channel_id: int, data: dict, user: dict, message: dict | None = None) -> int:
+        iid = self.fake.snowflake()
+        payload = {
+            "id": str(iid), "application_id": str(APP_ID), "token": f"tok{iid}", "version": 1,
+            "type": {"command": 2, "button": 3, "modal": 5}[kind],
+            "guild_id": str(GUILD_ID), "channel_id": str(channel_id),
+            "channel": {"id": str(channel_id), "type": 0},
+            "member": user, "data": data, "locale": "ru", "guild_locale": "ru",
+            "app_permissions": "0", "entitlements": [], "attachment_size_limit": 8 * 1024 * 1024,
+            "authorizing_integration_owners": {"0": str(GUILD_ID)}, "context": 0,
+        }
+        if message is not None:
+            payload["message"] = message
+
+        self.kinds[iid] = kind
+        self.fake.register_interaction(iid, channel_id, int(message["id"]) if message else None)
+        self.state.parse_interaction_create(payload)
+        return iid
+
+    async def wait_for(self, predicate, timeout: float = 10.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            result = predicate()
+            if result:
+                return result
+            await asyncio.sleep(0.02)
+        return None
+
+    async def create_strela(self, target: datetime) -> int | None:
+        tag, protiv = self.rng.sample(FACTIONS, 2)
+        options = {
+            "tag": tag, "protiv": protiv, "biz": str(self.rng.randint(1, 60)),
+            "vremya": target.strftime("%d.%m.%Y %H:%M"), "oruzhie": "любое", "lokaciya": "порт",
+        }
+        data = {"id": str(APP_ID + 1), "name": "strela", "type": 1,
+                "options": [{"name": k, "type": 3, "value": v} for k, v in options.items()]}
+        channel_id = self.rng.choice(self.channels)
+        iid = self.interaction("command", channel_id, data, self.rng.choice(self.users))
+
+        # ответ мог застрять за глобальным 429 — ждём с запасом, ack меряется отдельно
+        mid = await self.wait_for(lambda: self.fake.originals.get(f"tok{iid}"), timeout=30.0)
+        if mid is None:
+            self.failed += 1
+            return None
+        self.created.append(mid)
+        return mid
+
+    async def click(self, mid: int, action: str, user: dict) -> int:
+        message = self.fake.messages[mid]
+        data = {"custom_id": f"req_{action}", "component_type": 2}
+        return self.interaction("button", int(message["channel_id"]), data, user, message)
+
+    async def submit_size(self, button_iid: int, mid: int, user: dict):
+        modal = await self.wait_for(lambda: self.fake.modals.get(button_iid))
+        if modal is None:
+            self.failed += 1
+            return
+
+        def fill(components):
+            out = []
+            for c in components:
+                if c["type"] == 1:
+                    out.append({"type": 1, "components": fill(c["components"])})
+                elif c["type"] == 18:
+                    out.append({"type": 18, "component": fill([c["component"]])[0]})
+                else:
+                    out.append({"type": c["type"], "custom_id": c.get("custom_id"),
+                                "value": self.rng.choice(SIZES)})
+            return out
+
+        message = self.fake.messages[mid]
+        data = {"custom_id": modal["custom_id"], "components": fill(modal["components"])}
+        self.interaction("modal", int(message["channel_id"]), data, user, message)
+
+    async def user_session(self, target: datetime):
+        mid = await self.create_strela(target)
+        if mid is None or self.rng.random() >= self.args.clicks:
+            return
+
+        await asyncio.sleep(self.rng.uniform(0.2, 2.0))
+        action = self.rng.choices([a for a, _ in ACTIONS], [w for _, w in ACTIONS])[0]
+        user = self.rng.choice(self.users)
+
+        if action == "accept":
+            iid = await self.click(mid, "accept", user)
+            await asyncio.sleep(self.rng.uniform(0.5, 2.0))  # человек вводит состав
+            await self.submit_size(iid, mid, user)
+        else:
+            await self.click(mid, "reject", user)
+            if action == "reject_rollback":
+                await asyncio.sleep(self.rng.uniform(0.5, 2.0))
+                await self.click(mid, "rollback", user)
+
+    # ====== прогон ======
+    async def run(self) -> dict:
+        args = self.args
+        await self.setup()
+
+        lag = LagSampler()
+        lag.start()
+
+        gc.collect()
+        rss_before = rss_bytes()
+        if args.tracemalloc:
+            tracemalloc.start()
+        heap_before = tracemalloc.get_traced_memory()[0] if args.tracemalloc else 0
+
+        tz = ZoneInfo("Europe/Moscow")
+        base = datetime.now(tz).replace(second=0, microsecond=0) + timedelta(minutes=1)
+
+        t0 = time.monotonic()
+        sessions = []
+        for _ in range(args.strelas):
+            target = base + timedelta(minutes=self.rng.randint(1, args.minutes))
+            sessions.append(asyncio.create_task(self.user_session(target)))
+            await asyncio.sleep(1 / args.rate)
+        await asyncio.gather(*sessions)
+        created_in = time.monotonic() - t0
+
+        gc.collect()
+        active = len(self.sb.strelas)
+        rss_per = (rss_bytes() - rss_before) / max(active, 1)
+        heap_per = (tracemalloc.get_traced_memory()[0] - heap_before) / max(active, 1) if args.tracemalloc else None
+        if args.tracemalloc:
+            tracemalloc.stop()
+
+        # ждём, пока все стрелы дойдут до начала и очередь исходящих опустеет
+        last_target = (base + timedelta(minutes=args.minutes)).timestamp()
+        timeout = max(last_target - time.time(), 0) + args.grace
+        drained = await self.wait_for(
+            lambda: not self.sb.strelas and len(self.sb.outbound) == 0 and not self.sb.strela_locks,
+            timeout,
+        )
+        elapsed = time.monotonic() - t0
+        lag.stop()
+
+        return self.report(elapsed, created_in, active, rss_per, heap_per, lag.samples, bool(drained))
+
+    def report(self, elapsed, created_in, active, rss_per, heap_per, lag_samples, drained) -> dict:
+        fake = self.fake
+        acks = fake.ack_latencies()
+        by_kind: dict[str, list[float]] = {}
+        for iid, value in acks.items():
+            by_kind.setdefault(self.kinds.get(iid, "?"), []).append(value)
+        all_acks = list(acks.values())
+        minutes = elapsed / 60
+
+        return {
+            "strelas": self.args.strelas,
+            "created": len(self.created),
+            "failed": self.failed,
+            "elapsed_s": round(elapsed, 1),
+            "create_phase_s": round(created_in, 1),
+            "rest_calls": fake.total_calls(),
+            "rest_per_min": round(fake.total_calls() / minutes, 1),
+            "rest_by_route_per_min": {k: round(v / minutes, 1) for k, v in sorted(fake.calls.items())},
+            "rate_limited": dict(fake.rate_limited),
+            "unknown_routes": dict(fake.unknown),
+            "ack": {
+                kind: {
+                    "n": len(values),
+                    "p50_ms": round(percentile(values, 50) * 1000, 1),
+                    "p95_ms": round(percentile(values, 95) * 1000, 1),
+                    "p99_ms": round(percentile(values, 99) * 1000, 1),
+                    "max_ms": round(max(values) * 1000, 1),
+                }
+                for kind, values in sorted(by_kind.items())
+            },
+            "ack_p99_ms": round(percentile(all_acks, 99) * 1000, 1),
+            "ack_over_deadline": sum(1 for v in all_acks if v > ACK_DEADLINE),
+            "unacked": len(fake.interactions) - len(acks),
+            "loop_lag_ms": {
+                "p50": round(percentile(lag_samples, 50) * 1000, 2),
+                "p99": round(percentile(lag_samples, 99) * 1000, 2),
+                "max": round(max(lag_samples, default=0) * 1000, 2),
+            },
+            "active_strelas": active,
+            "rss_per_strela_kb": round(rss_per / 1024, 2),
+            "heap_per_strela_kb": round(heap_per / 1024, 2) if heap_per is not None else None,
+            "drained": drained,
+            "leftover": {
+                "strelas": len(self.sb.strelas),
+                "scheduled": len(self.sb.scheduler),
+                "outbound": len(self.sb.outbound),
+                "locks": len(self.sb.strela_locks),
+            },
+        }
+
+
+def print_report(r: dict, bot_log: list[str]):
+    print(f"стрел: {r['created']}/{r['strelas']} (ошибок {r['failed']}), "
+          f"прогон {r['elapsed_s']} с, создание {r['create_phase_s']} с")
+    print(f"REST: {r['rest_calls']} запросов, {r['rest_per_min']}/мин; 429: {r['rate_limited'] or 0}")
+    for route, per_min in r["rest_by_route_per_min"].items():
+        print(f"  {route:<16} {per_min:>8}/мин")
+    if r["unknown_routes"]:
+        print(f"  неизвестные маршруты: {r['unknown_routes']}")
+    print(f"ack (p99 {r['ack_p99_ms']} мс, дольше {ACK_DEADLINE:.0f} с: {r['ack_over_deadline']}, "
+          f"без ответа: {r['unacked']})")
+    for kind, s in r["ack"].items():
+        print(f"  {kind:<8} n={s['n']:<5} p50={s['p50_ms']}мс p95={s['p95_ms']}мс "
+              f"p99={s['p99_ms']}мс max={s['max_ms']}мс")
+    lag = r["loop_lag_ms"]
+    print(f"лаг event loop: p50={lag['p50']}мс p99={lag['p99']}мс max={lag['max']}мс")
+    heap = f", heap {r['heap_per_strela_kb']} КБ" if r["heap_per_strela_kb"] is not None else ""
+    print(f"память на стрелу ({r['active_strelas']} активных): RSS {r['rss_per_strela_kb']} КБ{heap}")
+    if r["drained"]:
+        print("очередь исходящих и таймеры разобраны полностью")
+    else:
+        print(f"НЕ успели разобрать за --grace: {r['leftover']}")
+
+    errors = [line for line in bot_log if "ERROR" in line]
+    print(f"лог бота: {len(bot_log)} строк, с ERROR: {len(errors)}")
+    for line in errors[:10]:
+        print("  " + line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота стрел без сети")
+    parser.add_argument("--strelas", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=25.0, help="новых /strela в секунду")
+    parser.add_argument("--minutes", type=int, default=2, help="разброс начала стрел, мин")
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--members", type=int, default=2000, help="участников без ролей фракций")
+    parser.add_argument("--members-per-role", type=int, default=3)
+    parser.add_argument("--clicks", type=float, default=0.7, help="доля стрел, по которым жмут кнопки")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа REST, с")
+    parser.add_argument("--chaos-429", type=float, default=0.0, help="вероятность лишнего 429")
+    parser.add_argument("--grace", type=float, default=60.0, help="запас после последней стрелы, с")
+    parser.add_argument("--board", action="store_true", help="режим доски (STRELA_BOARD=1)")
+    parser.add_argument("--tracemalloc", action="store_true", help="точная память Python на стрелу")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="куда записать отчёт в JSON")
+    parser.add_argument("--max-ack-p99", type=float, help="порог p99 ack, с (для CI)")
+    parser.add_argument("--max-lag-p99", type=float, help="порог p99 лага цикла, с (для CI)")
+    parser.add_argument("--verbose", action="store_true", help="не прятать вывод бота")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="strela-bench-")
+    config = {str(GUILD_ID): {
+        "channels": [GUILD_ID + 100 + i for i in range(args.channels)],
+        "factions": {tag: {"leader": Harness.role_id(i, 0), "deputy": Harness.role_id(i, 1)}
+                     for i, tag in enumerate(FACTIONS)},
+        "sizes": SIZES,
+    }}
+    with open(os.path.join(tmp, "guilds.json"), "w") as f:
+        json.dump(config, f)
+
+    # всё окружение бота — до импорта: он читает его на уровне модуля
+    os.environ["STRELA_DB"] = os.path.join(tmp, "strela.db")
+    os.environ["STRELA_CONFIG"] = os.path.join(tmp, "guilds.json")
+    os.environ["STRELA_CONFLICT_MODE"] = "off"  # случайные стрелы иначе упрутся в занятые слоты
+    os.environ.setdefault("STRELA_METRICS_PORT", "0")  # порт в CI не нужен
+    if args.board:
+        os.environ["STRELA_BOARD"] = "1"
+
+    import bot as strela_bot
+
+    async def run():
+        fake = FakeDiscord(APP_ID, latency=args.latency, chaos_429=args.chaos_429, seed=args.seed)
+        return await Harness(args, strela_bot, fake).run()
+
+    log = io.StringIO()
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else log):
+        result = asyncio.run(run())
+
+    bot_log = log.getvalue().splitlines()
+    print_report(result, bot_log)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    failed = result["failed"] > 0 or result["unacked"] > 0
+    if args.max_ack_p99 is not None and result["ack_p99_ms"] > args.max_ack_p99 * 1000:
+        print(f"FAIL: ack p99 {result['ack_p99_ms']} мс > {args.max_ack_p99 * 1000:.0f} мс")
+        failed = True
+    if args.max_lag_p99 is not None and result["loop_lag_ms"]["p99"] > args.max_lag_p99 * 1000:
+        print(f"FAIL: лаг p99 {result['loop_lag_ms']['p99']} мс > {args.max_lag_p99 * 1000:.0f} мс")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Память процесса на кэш участников: обычный режим против STRELA_LEAN_MEMBERS=1
+на синтетическом сервере без сети.
+
+    python bench/members_rss.py --members 50000
+
+Каждый режим идёт в отдельном процессе (RSS не смешивается): бот импортируется
+как есть, сервер добавляется пустым, а участники приходят чанками по 1000 через
+ту же таблицу разбора GUILD_MEMBERS_CHUNK, что и из шлюза. Замер — прирост RSS после
+сборки индекса ролей и пик (VmHWM) за время загрузки.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+GUILD_ID = 900000000000000002
+FACTIONS = [f"f{i}" for i in range(10)]
+CHUNK = 1000
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def peak_bytes() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def role_id(faction: int, kind: int) -> int:
+    return GUILD_ID + 1000 + 2 * faction + kind
+
+
+def member(uid: int, roles: list[str]) -> dict:
+    return {"user": {"id": str(uid), "username": f"user{uid}", "discriminator": "0",
+                     "global_name": f"User {uid}", "avatar": None},
+            "roles": roles, "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False,
+            "flags": 0, "nick": None}
+
+
+def chunks(total: int, per_role: int):
+    # держатели ролей впереди, дальше рядовые; payload собирается по чанку, а не весь сразу
+    holders = [(f, k) for f in range(len(FACTIONS)) for k in range(2) for _ in range(per_role)]
+    count = (total + CHUNK - 1) // CHUNK
+    for index in range(count):
+        batch = []
+        for n in range(index * CHUNK, min(total, (index + 1) * CHUNK)):
+            roles = [str(role_id(*holders[n]))] if n < len(holders) else []
+            batch.append(member(GUILD_ID + 10_000 + n, roles))
+        yield index, count, batch
+
+
+def run_mode(args):
+    tmp = tempfile.mkdtemp(prefix="strela-rss-")
+    factions = {tag: {"leader": role_id(i, 0), "deputy": role_id(i, 1)} for i, tag in enumerate(FACTIONS)}
+    with open(os.path.join(tmp, "guilds.json"), "w") as f:
+        json.dump({"default": {"channels": [1], "factions": factions, "sizes": ["2x2"]}}, f)
+
+    os.environ["STRELA_DB"] = os.path.join(tmp, "strela.db")
+    os.environ["STRELA_CONFIG"] = os.path.join(tmp, "guilds.json")
+    os.environ["STRELA_METRICS_PORT"] = "0"
+    if args.lean:
+        os.environ["STRELA_LEAN_MEMBERS"] = "1"
+
+    import bot as strela_bot
+
+    async def run():
+        client = strela_bot.bot
+        await client._async_setup_hook()
+        state = client._connection
+        loop = asyncio.get_running_loop()
+
+        def feed(nonce: str):
+            # через таблицу parsers, как шлюз: lean-режим перехватывает чанки там
+            parse = state.parsers["GUILD_MEMBERS_CHUNK"]
+            for index, count, batch in chunks(args.members, args.members_per_role):
+                parse({
+                    "guild_id": str(GUILD_ID), "members": batch, "nonce": nonce,
+                    "chunk_index": index, "chunk_count": count,
+                })
+
+        async def chunker(guild_id, query="", limit=0, presences=False, *, nonce=None):
+            loop.call_soon(feed, nonce)
+
+        state.chunker = chunker
+        state._add_guild_from_data({
+            "id": str(GUILD_ID), "name": "bench", "owner_id": str(GUILD_ID + 1),
+            "roles": [{"id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "position": 0,
+                       "color": 0, "hoist": False, "managed": False, "mentionable": False}],
+            "members": [], "channels": [], "threads": [], "emojis": [], "stickers": [],
+            "features": [], "member_count": args.members, "large": True, "unavailable": False,
+        })
+        guild = client.get_guild(GUILD_ID)
+
+        gc.collect()
+        before = rss_bytes()
+        await strela_bot.rebuild_role_index(guild)
+        gc.collect()
+        after = rss_bytes()
+
+        index = strela_bot.role_indexes[GUILD_ID]
+        holders = sum(len(index.members_of(role_id(f, k))) for f in range(len(FACTIONS)) for k in range(2))
+        return {
+            "mode": "lean" if args.lean else "full",
+            "members": args.members,
+            "cached_members": len(guild.members),
+            "role_holders": holders,
+            "rss_delta_mb": round((after - before) / 2**20, 1),
+            "peak_mb": round(peak_bytes() / 2**20, 1),
+        }
+
+    print(json.dumps(asyncio.run(run())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RSS кэша участников: обычный и lean-режим")
+    parser.add_argument("--members", type=int, default=50_000)
+    parser.add_argument("--members-per-role", type=int, default=3)
+    parser.add_argument("--lean", action="store_true", help=argparse.SUPPRESS)  # режим дочернего процесса
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_mode(args)
+        return
+
+    base = [sys.executable, os.path.abspath(__file__), "--child",
+            "--members", str(args.members), "--members-per-role", str(args.members_per_role)]
+    results = []
+    for lean in (False, True):
+        out = subprocess.run(base + (["--lean"] if lean else []), capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{'режим':<6} {'в кэше':>8} {'держатели':>10} {'ΔRSS, МБ':>10} {'пик, МБ':>9}")
+    for r in results:
+        print(f"{r['mode']:<6} {r['cached_members']:>8} {r['role_holders']:>10} "
+              f"{r['rss_delta_mb']:>10} {r['peak_mb']:>9}")
+
+
+if __name__ == "__main__":
+    main()
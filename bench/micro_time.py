@@ -0,0 +1,157 @@
+"""
+Микробенчмарк работы со временем: прежние реализации (ZoneInfo на каждый вызов,
+перебор форматов strptime через исключения, format_left без кэша) против
+нынешних (общий MSK, одно регулярное выражение, format_left с кэшем по минутам).
+
+    python bench/micro_time.py --strelas 500 --repeat 5
+
+Тик — то, что отсчёт делает по каждой стреле на каждой границе минуты:
+now, текст таймера, ключ отрисовки и время следующей смены текста.
+Клик — разбор времени из модалки плюс format_delta для ответа.
+Печатает лучшее из --repeat время на операцию в мкс.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+TIMES = ["21:10", "25.02.2030 21:10", "21:10 25.02.2030", " 7:05 ", "31.12.2031 23:59", "00:00"]
+
+
+# ====== прежние реализации ======
+
+def legacy_format_left(sec: int) -> str:
+    days = sec // 86400
+    sec %= 86400
+    hours = sec // 3600
+    sec %= 3600
+    mins = sec // 60
+
+    if days > 0:
+        return f"{days}д {hours:02d}ч {mins:02d}м"
+    return f"{hours:02d}ч {mins:02d}м"
+
+
+def legacy_parse_strela_time(vremya_text: str) -> datetime:
+    tz = ZoneInfo("Europe/Moscow")
+    s = vremya_text.strip()
+
+    fmts = ["%d.%m.%Y %H:%M", "%H:%M %d.%m.%Y", "%H:%M"]
+    for fmt in fmts:
+        try:
+            dt = datetime.strptime(s, fmt)
+            now = datetime.now(tz)
+
+            if fmt == "%H:%M":
+                dt = dt.replace(year=now.year, month=now.month, day=now.day)
+                dt = dt.replace(tzinfo=tz)
+                if dt <= now:
+                    dt = dt + timedelta(days=1)
+                return dt
+
+            return dt.replace(tzinfo=tz)
+        except ValueError:
+            pass
+
+    raise ValueError("Неверный формат времени. Пример: 21:10 или 25.02.2026 21:10")
+
+
+def legacy_format_delta(dt_target: datetime) -> str:
+    tz = ZoneInfo("Europe/Moscow")
+    now = datetime.now(tz)
+    sec = int((dt_target - now).total_seconds())
+    if sec <= 0:
+        return "✅ Уже началось / прошло"
+    return legacy_format_left(sec)
+
+
+# ====== замер ======
+
+def best_us(fn, number: int, repeat: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время: прежние и нынешние хелперы")
+    parser.add_argument("--strelas", type=int, default=500, help="стрел на один тик")
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--clicks", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="strela-micro-")
+    with open(os.path.join(tmp, "guilds.json"), "w") as f:
+        json.dump({"default": {"channels": [1], "factions": {}, "sizes": ["2x2"]}}, f)
+    os.environ["STRELA_DB"] = os.path.join(tmp, "strela.db")
+    os.environ["STRELA_CONFIG"] = os.path.join(tmp, "guilds.json")
+
+    import bot as strela_bot
+    import models
+    from models import MSK, Strela
+
+    # разбор обеими реализациями должен совпадать, иначе сравнивать нечего
+    for text in TIMES:
+        assert legacy_parse_strela_time(text) == strela_bot.parse_strela_time(text), text
+
+    now = datetime.now(MSK)
+    strelas = [
+        Strela(
+            message_id=i, guild_id=1, channel_id=1, author_id=1,
+            tag="f1", protiv="f2", biz=None, vremya="21:10", lokaciya="x", oruzhie="y", ping_to="",
+            target=now + timedelta(minutes=5 + i % 1500), created_at=0.0,
+        )
+        for i in range(args.strelas)
+    ]
+    next_change = strela_bot.next_countdown_change
+
+    def tick_legacy():
+        current = datetime.now(ZoneInfo("Europe/Moscow"))
+        for s in strelas:
+            legacy_format_left(int((s.target - current).total_seconds()))
+            next_change(s.target, current)
+
+    def tick_new():
+        current = datetime.now(MSK)
+        for s in strelas:
+            s.render_key(current)
+            next_change(s.target, current)
+
+    target = now + timedelta(hours=3)
+
+    def click_legacy():
+        for text in TIMES:
+            legacy_parse_strela_time(text)
+        legacy_format_delta(target)
+
+    def click_new():
+        for text in TIMES:
+            strela_bot.parse_strela_time(text)
+        strela_bot.format_delta(target)
+
+    # прогрев кэша минут: в работе он заполняется за первые тики
+    tick_new()
+
+    rows = [
+        (f"тик, {args.strelas} стрел", best_us(tick_legacy, args.ticks, args.repeat),
+         best_us(tick_new, args.ticks, args.repeat)),
+        (f"клик, {len(TIMES)} разборов", best_us(click_legacy, args.clicks // len(TIMES), args.repeat),
+         best_us(click_new, args.clicks // len(TIMES), args.repeat)),
+        ("format_left", best_us(lambda: legacy_format_left(98765), args.clicks, args.repeat),
+         best_us(lambda: models.format_left(98765), args.clicks, args.repeat)),
+    ]
+
+    print(f"{'операция':<24} {'было, мкс':>10} {'стало, мкс':>11} {'×':>6}")
+    for name, old, new in rows:
+        print(f"{name:<24} {old:>10.2f} {new:>11.2f} {old / new:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+from datetime import datetime
+from typing import Callable, Iterable
+
+import discord
+
+from models import Strela, STATUS_ACCEPTED, STATUS_REJECTED
+
+# лимит описания embed — 4096 символов; оставляем запас под хвост "и ещё N"
+BOARD_TEXT_LIMIT = 3900
+
+
+def board_line(strela: Strela, left: str) -> str:
+    if strela.status == STATUS_ACCEPTED:
+        status = f"🟢 Принято ({strela.size})"
+    elif strela.status == STATUS_REJECTED:
+        status = "🔴 Отказано"
+    else:
+        status = "🟠 Ожидает"
+
+    biz = f" · 🏢 `{strela.biz}`" if strela.biz else ""
+    return (
+        f"**`{strela.tag.upper()}` → `{strela.protiv.upper()}`**{biz} · 🕒 `{strela.vremya}`\n"
+        f"⏳ {left} · {status} · [к стреле]({strela.jump_url})"
+    )
+
+
+def render_board(items: Iterable[Strela], format_countdown: Callable[[datetime], str]) -> discord.Embed:
+    """
+    Сводка по каналу: все ближайшие стрелы с отсчётом и статусом.
+    items — уже отсортированы по времени начала, format_countdown — как format_delta.
+    """
+    lines = []
+    size = 0
+    items = list(items)
+
+    for i, strela in enumerate(items):
+        line = board_line(strela, format_countdown(strela.target))
+        if size + len(line) > BOARD_TEXT_LIMIT:
+            lines.append(f"… и ещё {len(items) - i}")
+            break
+        lines.append(line)
+        size += len(line) + 2
+
+    e = discord.Embed(
+        title="📋 Ближайшие стрелы",
+        description="\n\n".join(lines) if lines else "Ближайших стрел нет.",
+        color=discord.Color.orange(),
+    )
+    e.set_footer(text="Обновляется автоматически")
+    return e
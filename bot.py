@@ -1,548 +1,964 @@
 import os
-import re
 import discord
 import asyncio
+import argparse
+import contextlib
+import csv
+import functools
+import hashlib
+import io
+import itertools
+import json
+import re
+import time
 from datetime import datetime, timedelta
+from typing import Iterable
 from discord.ext import commands
 from discord import app_commands
-from zoneinfo import ZoneInfo
+
+from scheduler import DeadlineScheduler
+from storage import StrelaStore
+from role_index import RoleIndex
+from fanout import DMDigest, DMFanout
+from outbound import OutboundQueue, PRIORITY_COUNTDOWN, PRIORITY_NOTIFY, PRIORITY_USER
+from models import MSK, Strela, STATUS_ACCEPTED, STATUS_PENDING, STATUS_REJECTED, format_left
+from board import render_board
+from slots import SlotIndex
+from completion import PrefixIndex
+from config import ConfigStore, GuildConfig, normalize_tag
+from compaction import Compactor
+from stats import PERIODS, record_created, record_started, record_transition, render_stats, since_day
+from runtime import install_event_loop, watch_slow_callbacks
+from metrics import (
+    REGISTRY, INTERACTION_SECONDS, ERRORS, timed,
+    rest_trace_config, serve as serve_metrics, watch_loop_lag,
+)
+
+# от запуска процесса до первого on_ready
+STARTED_AT = time.monotonic()
+
+# STRELA_PROCESS: all — всё в одном процессе (по умолчанию);
+# gateway — только шлюз и взаимодействия: отсчёт, уведомления, доски, ЛС и уборку
+# делает worker.py (только REST), изменения он узнаёт из таблицы bus в общей базе
+PROCESS = os.getenv("STRELA_PROCESS", "all")
+GATEWAY_ONLY = PROCESS == "gateway"
 
 
-def parse_strela_time(vremya_text: str) -> datetime:
+# все три формата одним проходом: [дата ]ЧЧ:ММ[ дата]
+TIME_RE = re.compile(
+    r"(?:(?P<d1>\d{1,2})\.(?P<m1>\d{1,2})\.(?P<y1>\d{4})\s+)?"
+    r"(?P<hh>\d{1,2}):(?P<mm>\d{1,2})"
+    r"(?:\s+(?P<d2>\d{1,2})\.(?P<m2>\d{1,2})\.(?P<y2>\d{4}))?",
+    re.ASCII,
+)
+TIME_FORMAT_ERROR = "Неверный формат времени. Пример: 21:10 или 25.02.2026 21:10"
+
+
+def parse_strela_time(vremya_text: str, now: datetime | None = None) -> datetime:
     """
     Принимает:
     - "21:10"
     - "25.02.2026 21:10"
     - "21:10 25.02.2026"
     Возвращает datetime в TZ Europe/Moscow.
+    now — момент, от которого считается "сегодня" для одного лишь времени
+    (по умолчанию текущий).
     """
-    tz = ZoneInfo("Europe/Moscow")
-    s = vremya_text.strip()
-
-    fmts = ["%d.%m.%Y %H:%M", "%H:%M %d.%m.%Y", "%H:%M"]
-    for fmt in fmts:
-        try:
-            dt = datetime.strptime(s, fmt)
-            now = datetime.now(tz)
-
-            if fmt == "%H:%M":
-                # если только время — считаем сегодня по МСК, если уже прошло — завтра
-                dt = dt.replace(year=now.year, month=now.month, day=now.day)
-                dt = dt.replace(tzinfo=tz)
-                if dt <= now:
-                    dt = dt + timedelta(days=1)  # завтра
-                return dt
+    m = TIME_RE.fullmatch(vremya_text.strip())
+    if m is None or (m["d1"] and m["d2"]):
+        raise ValueError(TIME_FORMAT_ERROR)
 
+    day, month, year = (m["d1"], m["m1"], m["y1"]) if m["d1"] else (m["d2"], m["m2"], m["y2"])
+    try:
+        if day:
             # есть дата
-            return dt.replace(tzinfo=tz)
-        except ValueError:
-            pass
+            return datetime(int(year), int(month), int(day), int(m["hh"]), int(m["mm"]), tzinfo=MSK)
+
+        # если только время — считаем сегодня по МСК, если уже прошло — завтра
+        if now is None:
+            now = datetime.now(MSK)
+        dt = now.replace(hour=int(m["hh"]), minute=int(m["mm"]), second=0, microsecond=0)
+    except ValueError:
+        raise ValueError(TIME_FORMAT_ERROR) from None
 
-    raise ValueError("Неверный формат времени. Пример: 21:10 или 25.02.2026 21:10")
+    if dt <= now:
+        dt = dt + timedelta(days=1)  # завтра
+    return dt
 
 
 def format_delta(dt_target: datetime) -> str:
-    tz = ZoneInfo("Europe/Moscow")
-    now = datetime.now(tz)
-    diff = dt_target - now
-    sec = int(diff.total_seconds())
+    sec = int((dt_target - datetime.now(MSK)).total_seconds())
 
     if sec <= 0:
         return "✅ Уже началось / прошло"
 
-    days = sec // 86400
-    sec %= 86400
-    hours = sec // 3600
-    sec %= 3600
-    mins = sec // 60
+    return format_left(sec)
 
-    if days > 0:
-        return f"{days}д {hours:02d}ч {mins:02d}м"
-    return f"{hours:02d}ч {mins:02d}м"
 
+def next_countdown_change(dt_target: datetime, now: datetime) -> datetime:
+    # текст "ЧЧч ММм" меняется только когда остаток пересекает границу минуты
+    left_sec = int((dt_target - now).total_seconds())
+    return dt_target - timedelta(seconds=(left_sec // 60) * 60)
 
-async def countdown_updater(message: discord.Message, dt_target: datetime):
-    while True:
-        try:
-            # берём актуальную версию сообщения
-            message = await message.channel.fetch_message(message.id)
-            if not message.embeds:
-                return
 
-            emb = message.embeds[0]
+def strela_message(strela: Strela) -> discord.PartialMessage:
+    # правим через канал, а не через webhook взаимодействия (его токен живёт 15 минут)
+    channel = bot.get_partial_messageable(strela.channel_id, guild_id=strela.guild_id)
+    return channel.get_partial_message(strela.message_id)
 
-            # Определяем статус из поля "Статус"
-            status_value = ""
-            for f in emb.fields:
-                if "Статус" in f.name:
-                    status_value = (f.value or "").strip()
-                    break
 
-            is_accepted = ("Принято" in status_value) or ("🟢" in status_value)
+def finish_countdown(strela: Strela):
+    strela.is_open = False
+    store.close(strela.message_id)
+    strelas.pop(strela.message_id, None)
+    touch_board(strela.channel_id)
 
-            # Считаем остаток времени
-            tz = ZoneInfo("Europe/Moscow")
-            now = datetime.now(tz)
-            left_sec = int((dt_target - now).total_seconds())
 
-            # Значение таймера в поле
-            if left_sec <= 0:
-                if is_accepted:
-                    timer_text = "✅ Уже началось / прошло"
-                else:
-                    timer_text = "⏳ Время наступило (не принято)"
-            else:
-                # обычный отсчёт (без "✅")
-                days = left_sec // 86400
-                rem = left_sec % 86400
-                hours = rem // 3600
-                rem %= 3600
-                mins = rem // 60
-                if days > 0:
-                    timer_text = f"{days}д {hours:02d}ч {mins:02d}м"
-                else:
-                    timer_text = f"{hours:02d}ч {mins:02d}м"
-
-            # Пересобираем embed: меняем ТОЛЬКО поле таймера
-            new = discord.Embed(title=emb.title, description=emb.description, color=emb.color)
-
-            found_timer = False
-            for f in emb.fields:
-
-    # скрываем служебное поле времени
-                 if f.name == "__strela_time__":
-                     continue
-
-                 if f.name == "⏳ До стрелы":
-                     new.add_field(name="⏳ До стрелы", value=timer_text, inline=False)
-                     found_timer = True
-                 else:
-                     new.add_field(name=f.name, value=f.value, inline=f.inline)
-
-            if not found_timer:
-                new.add_field(name="⏳ До стрелы", value=timer_text, inline=False)
-
-            if emb.footer:
-                new.set_footer(text=emb.footer.text)
-
-            await message.edit(embed=new)
-
-            # Если время наступило:
-            if left_sec <= 0:
-                # 1) НЕ принято -> ничего не отправляем, просто стоп
-                if not is_accepted:
-                    return
-
-                # 2) Принято -> отправляем reply и удаляем через 5 минут
-                description = emb.description or ""
-
-                # Автор (из поля "Автор")
-                author_val = ""
-                for f in emb.fields:
-                    if f.name == "Автор":
-                        author_val = f.value or ""
-                        break
-
-                # Кому (из поля "Кому") — там у тебя пинги лидера/зама
-                enemy_roles = ""
-                for f in emb.fields:
-                    if f.name == "Кому":
-                        enemy_roles = f.value or ""
-                        break
-
-                # Фракции + бизнес из description
-                tag = "UNKNOWN"
-                protiv = "UNKNOWN"
-                biz = None
-
-                m1 = re.search(r"Фракция:\s*\*\*`([^`]+)`\*\*", description)
-                m2 = re.search(r"Против:\s*\*\*`([^`]+)`\*\*", description)
-                m3 = re.search(r"Бизнес:\s*\*\*`([^`]+)`\*\*", description)
-
-                if m1:
-                    tag = m1.group(1)
-                if m2:
-                    protiv = m2.group(1)
-                if m3:
-                    biz = m3.group(1)
-
-                if biz:
-                    notify_text = (
-                        f"🚨 Стрела между {tag} и {protiv} за бизнес {biz} началась!\n"
-                        f"{author_val}\n{enemy_roles}"
-                    )
-                else:
-                    notify_text = (
-                        f"🚨 Стрела между {tag} и {protiv} началась!\n"
-                        f"{author_val}\n{enemy_roles}"
-                    )
-
-                allowed = discord.AllowedMentions(roles=True, users=True, everyone=False)
-
-                await message.reply(
+def submit_countdown_edit(strela: Strela):
+    # правка таймера — самый низкий приоритет; неотправленная заменяется свежей
+    outbound.submit(
+        strela.channel_id,
+        PRIORITY_COUNTDOWN,
+        functools.partial(push_countdown_edit, strela),
+        coalesce_key=("countdown", strela.message_id),
+    )
+
+
+async def push_countdown_edit(strela: Strela):
+    # рисуем в момент отправки и под замком: пока правка ждала очереди, кнопка могла
+    # сменить статус. Сам запрос — уже без замка, иначе клик ждал бы правку таймера
+    # вместе с ретраями discord.py после 429
+    async with strela_lock(strela.message_id):
+        now = datetime.now(MSK)
+        key = strela.render_key(now)
+        if key == strela.shown_key:
+            return
+        embed = strela.render(now)
+
+    try:
+        await strela_message(strela).edit(embed=embed)
+    except discord.NotFound:
+        # сообщение удалили — отсчитывать больше нечего
+        scheduler.cancel(strela.message_id)
+        finish_countdown(strela)
+        return
+    except discord.HTTPException as e:
+        print("COUNTDOWN ERROR:", e)
+        ERRORS.inc("countdown")
+        return
+
+    if strela.render_key(now) == key:
+        strela.shown_key = key
+    else:
+        # пока правка была в сети, кнопка сменила статус — наша правка могла лечь
+        # поверх её ответа со старым статусом; перерисуем ещё раз
+        strela.shown_key = None
+        submit_countdown_edit(strela)
+
+
+async def countdown_tick(strela: Strela) -> float | None:
+    """
+    Один шаг обратного отсчёта. Вызывается планировщиком только в моменты,
+    когда меняется видимый текст таймера, и ровно в момент начала стрелы.
+    Возвращает время следующего пробуждения (unix) или None, если отсчёт окончен.
+    Сообщение не читается: всё рисуется из записи Strela.
+    """
+    now = datetime.now(MSK)
+
+    # текст не изменился (например, проснулись на мгновение раньше) — не тратим запрос
+    if strela.render_key(now) != strela.shown_key:
+        submit_countdown_edit(strela)
+
+    if not strela.started(now):
+        if BOARD_MODE:
+            # отсчёт показывает доска, а сообщение стрелы нужно только к началу
+            return strela.target.timestamp()
+        return next_countdown_change(strela.target, now).timestamp()
+
+    # Время наступило:
+    # 1) НЕ принято -> ничего не отправляем, просто стоп
+    # 2) Принято -> отправляем reply и удаляем через 5 минут
+    # 3) Принято, но начало проспали (бот лежал) -> тихо закрываем, без пинга
+    late = (now - strela.target).total_seconds()
+    if strela.status == STATUS_ACCEPTED and late > NOTIFY_GRACE:
+        print(f"NOTIFY SKIPPED: {strela.message_id} началась {late / 60:.0f} мин назад")
+    elif strela.status == STATUS_ACCEPTED:
+        notify_text = strela.notify_text()
+        message = strela_message(strela)
+        allowed = discord.AllowedMentions(roles=True, users=True, everyone=False)
+
+        async def send_notify():
+            try:
+                reply = await message.reply(
                     content=notify_text,
                     allowed_mentions=allowed,
                     mention_author=True,
-                    delete_after=300  # 5 минут
                 )
+                # удаление через 5 минут — через хранилище, а не delete_after: переживает рестарт
+                delete_at = time.time() + NOTIFY_TTL
+                store.schedule_delete(reply.channel.id, reply.id, delete_at)
+                wake_compaction(delete_at)
+            except Exception as e:
+                print("NOTIFY ERROR:", e)
+                ERRORS.inc("notify")
+
+        # уведомление о начале уходит раньше всего остального в этом канале
+        outbound.submit(strela.channel_id, PRIORITY_NOTIFY, send_notify)
+
+    # начало — по расписанию стрелы, а не по моменту, когда его заметили
+    record_started(store, strela, strela.target.timestamp())
+    finish_countdown(strela)
+    return None
+
+
+# ====== ДОСКА СТРЕЛ ======
+# Режим доски (STRELA_BOARD=1): в каждом канале стрел одно закреплённое сообщение
+# со всеми ближайшими стрелами. Отсчёт обновляется одной правкой доски за тик,
+# а сообщения самих стрел правятся только при смене статуса и в момент начала.
+BOARD_MODE = os.getenv("STRELA_BOARD") == "1"
+Strela.board_mode = BOARD_MODE
+
+# описание доски, которое сейчас видно в канале
+board_shown: dict[int, str] = {}
+
+
+def channel_strelas(channel_id: int) -> list[Strela]:
+    return sorted(
+        (s for s in strelas.values() if s.channel_id == channel_id),
+        key=lambda s: s.target,
+    )
 
-                return
 
-            await asyncio.sleep(60)
+def touch_board(channel_id: int):
+    # перерисовать доску как можно скорее (новая стрела, смена статуса, конец отсчёта);
+    # при разделении доски ведёт воркер
+    if BOARD_MODE and not GATEWAY_ONLY:
+        scheduler.schedule(
+            ("board", channel_id),
+            datetime.now(MSK).timestamp(),
+            functools.partial(board_tick, channel_id),
+        )
 
-        except Exception as e:
-            print("COUNTDOWN ERROR:", e)
-            return
+
+async def board_tick(channel_id: int) -> float | None:
+    now = datetime.now(MSK)
+    items = channel_strelas(channel_id)
+
+    if render_board(items, format_delta).description != board_shown.get(channel_id):
+        outbound.submit(
+            channel_id,
+            PRIORITY_COUNTDOWN,
+            functools.partial(push_board, channel_id),
+            coalesce_key=("board", channel_id),
+        )
+
+    if not items:
+        return None
+    # следующий тик — когда у ближайшей по смене текста стрелы сменятся минуты
+    return min(next_countdown_change(s.target, now) for s in items).timestamp()
+
+
+async def push_board(channel_id: int):
+    embed = render_board(channel_strelas(channel_id), format_delta)
+    if embed.description == board_shown.get(channel_id):
+        return
+
+    channel = bot.get_partial_messageable(channel_id)
+    message_id = store.get_board(channel_id)
+
+    try:
+        if message_id is not None:
+            try:
+                await channel.get_partial_message(message_id).edit(embed=embed)
+            except discord.NotFound:
+                message_id = None  # доску удалили — создадим заново
+
+        if message_id is None:
+            msg = await channel.send(embed=embed)
+            store.set_board(channel_id, msg.id)
+            try:
+                await msg.pin()
+            except discord.HTTPException as e:
+                print("BOARD PIN ERROR:", e)
+                ERRORS.inc("board_pin")
+    except discord.HTTPException as e:
+        print("BOARD ERROR:", e)
+        ERRORS.inc("board")
+        return
+
+    board_shown[channel_id] = embed.description
 
 
 intents = discord.Intents.default()
 intents.members = True  # ✅ нужно, чтобы видеть участников по ролям
 
-bot = commands.Bot(command_prefix="!", intents=intents)
-# ====== НАСТРОЙКИ ПИНГОВ ПО ТЕГАМ ======
-ALLOWED_CHANNELS = [
-    1468386694175789188,  # канал 1
-    1199092928472174734,  # канал 2
-    1350588850744987791, 
-    1199092929331990573, # канал 3
-]
-
-FACTION_PINGS = {
-    "rm":      {"leader": 1199092925913632839, "deputy": 1199092925506797596},
-    "lcn":     {"leader": 1199092925859123281, "deputy": 1199092925506797595},
-    "warlock": {"leader": 1199092925859123280, "deputy": 1199092925506797594},
-    "yakuza":  {"leader": 1199092925859123279, "deputy": 1199092925506797593},
-    "trb":     {"leader": 1199710835384275024, "deputy": 1199710842715897947},
-}
+# STRELA_LEAN_MEMBERS=1 — не держать объекты участников вообще: лидеров/замов знает
+# только RoleIndex (голые id), он строится по первой стреле на сервере
+LEAN_MEMBERS = os.getenv("STRELA_LEAN_MEMBERS") == "1"
+
+if LEAN_MEMBERS:
+    member_options = dict(member_cache_flags=discord.MemberCacheFlags.none(), chunk_guilds_at_startup=False)
+else:
+    member_options = {}
+
+# trace считает задержку и 429 каждого REST-запроса (включая ответы на взаимодействия)
+bot = commands.Bot(command_prefix="!", intents=intents, http_trace=rest_trace_config(), **member_options)
+
+# один планировщик на все активные стрелы (ключ — id сообщения)
+scheduler = DeadlineScheduler()
+
+# стрелы на диске: переживают рестарт воркера
+store = StrelaStore()
+
+# открытые стрелы в памяти — единственный источник правды для кнопок и отсчёта;
+# хранилище только повторяет их на диск
+strelas: dict[int, Strela] = {}
+
+# все исходящие правки/сообщения в каналы: приоритеты и бюджет на канал
+outbound = OutboundQueue()
+
+# фоновая рассылка ЛС лидерам/замам
+dm_fanout = DMFanout(bot, store)
+
+# уведомления одному получателю за STRELA_DM_DIGEST_SECONDS склеиваются в одно ЛС;
+# 0 — слать сразу (стрелы одного /strela_batch склеиваются всё равно)
+DM_DIGEST_SECONDS = float(os.getenv("STRELA_DM_DIGEST_SECONDS", "20"))
+DM_DIGEST_LINES = 30
+
+
+def render_leader_dm(items: list[tuple[str, str, str]]) -> discord.Embed:
+    # items — (тег забившей фракции, время, ссылка на стрелу)
+    if len(items) == 1:
+        dm_embed = discord.Embed(
+            title="🚨 Твоей организации забили стрелу",
+            description=(
+                "Привет! Твоей организации забили стрелу.\n\n"
+                "Вся информация и принятие тут:"
+            ),
+            color=discord.Color.orange()
+        )
+        dm_embed.add_field(
+            name="🔗 Ссылка на сообщение стрелы",
+            value=items[0][2],
+            inline=False
+        )
+        return dm_embed
+
+    lines = [f"• `{tag.upper()}` 🕒 `{vremya}` — {url}" for tag, vremya, url in items[:DM_DIGEST_LINES]]
+    if len(items) > DM_DIGEST_LINES:
+        lines.append(f"… и ещё {len(items) - DM_DIGEST_LINES}")
+    return discord.Embed(
+        title=f"🚨 Твоей организации забили стрел: {len(items)}",
+        description="Вся информация и принятие по ссылкам:\n" + "\n".join(lines),
+        color=discord.Color.orange()
+    )
 
-ALLOWED_SIZES = {"2x2", "3x3", "4x4", "5x5"}
 
+dm_digest = DMDigest(dm_fanout, render_leader_dm, DM_DIGEST_SECONDS)
 
-def normalize_tag(text: str) -> str:
-    return re.sub(r"\s+", "", text.strip().lower())
+# уборка закрытых стрел и просроченных уведомлений (в том же планировщике)
+COMPACT_KEY = "compact"
+NOTIFY_TTL = 300  # 5 минут
+# опоздание, после которого "Стрела началась!" уже не шлём (например, после простоя)
+NOTIFY_GRACE = 120
 
 
-def build_ping_text(tag: str) -> str:
-    key = normalize_tag(tag)
-    roles = FACTION_PINGS.get(key)
+def forget_strela(message_id: int):
+    # стрела ушла в архив — в памяти от неё ничего не остаётся
+    strelas.pop(message_id, None)
+    slot_index.remove(message_id)
+
+
+compactor = Compactor(bot, store, outbound, on_archived=forget_strela)
+
+
+def wake_compaction(at: float):
+    # не откладываем уже назначенный более ранний проход
+    when = scheduler.when(COMPACT_KEY)
+    if when is None or at < when:
+        scheduler.schedule(COMPACT_KEY, at, compactor.run)
+
+
+REGISTRY.gauge("strela_active_countdowns", "Открытые стрелы с отсчётом", lambda: len(strelas))
+REGISTRY.gauge("strela_scheduled_total", "Записей в планировщике", lambda: len(scheduler))
+REGISTRY.gauge("strela_outbound_queued", "Запросов в очереди исходящих", lambda: len(outbound))
+REGISTRY.gauge("strela_dm_digest_pending", "Получателей, ждущих склеенного ЛС", lambda: len(dm_digest))
+
+# ссылки на фоновые задачи, чтобы их не собрал GC до завершения
+background_tasks: set[asyncio.Task] = set()
+
+
+def run_in_background(coro):
+    # для того, что не должно задерживать ответ на взаимодействие
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# ====== НАСТРОЙКИ СЕРВЕРОВ ======
+# каналы, роли фракций и составы — в guilds.json (STRELA_CONFIG), перечитываются /strela_reload
+config = ConfigStore()
+
+# guild_id -> кто держит роли лидеров/замов из конфига этого сервера
+role_indexes: dict[int, RoleIndex] = {}
+# guild_id -> идущая загрузка участников (в lean-режиме), чтобы не качать сервер дважды
+role_index_loading: dict[int, asyncio.Task] = {}
+# nonce запроса участников -> (индекс, который он наполняет, future конца загрузки)
+role_index_chunks: dict[str, tuple[RoleIndex, asyncio.Future]] = {}
+
+
+async def rebuild_role_index(guild: discord.Guild):
+    cfg = config.get(guild.id)
+    if cfg is None:
+        role_indexes.pop(guild.id, None)
+        return
+    index = RoleIndex(cfg.role_ids)
+    if LEAN_MEMBERS:
+        await fill_role_index_raw(guild, index)
+    else:
+        if not guild.chunked:
+            await guild.chunk()
+        index.rebuild(guild.members)
+    role_indexes[guild.id] = index
+
+
+async def fill_role_index_raw(guild: discord.Guild, index: RoleIndex):
+    # guild.chunk(cache=False) всё равно собрал бы объекты Member на весь сервер
+    # до конца загрузки — здесь чанки разбираются сразу в id и выбрасываются
+    nonce = os.urandom(16).hex()
+    done = asyncio.get_running_loop().create_future()
+    role_index_chunks[nonce] = (index, done)
+    try:
+        await bot._connection.chunker(guild.id, nonce=nonce)
+        await asyncio.wait_for(done, timeout=max(10.0, (guild.member_count or 0) / 5000))
+    finally:
+        role_index_chunks.pop(nonce, None)
+
+
+def parse_role_index_chunk(data) -> bool:
+    entry = role_index_chunks.get(data.get("nonce"))
+    if entry is None:
+        return False  # чужой запрос (например, guild.chunk()) — пусть разбирает discord.py
+
+    index, done = entry
+    for member in data.get("members", ()):
+        user = member["user"]
+        if not user.get("bot"):
+            index.set_roles(int(user["id"]), member.get("roles", ()))
+    if data.get("chunk_index", 0) + 1 == data.get("chunk_count") and not done.done():
+        done.set_result(None)
+    return True
+
+
+async def ensure_role_index(guild: discord.Guild) -> RoleIndex | None:
+    index = role_indexes.get(guild.id)
+    if index is not None:
+        return index
+
+    task = role_index_loading.get(guild.id)
+    if task is None:
+        task = role_index_loading[guild.id] = asyncio.create_task(rebuild_role_index(guild))
+        task.add_done_callback(lambda _: role_index_loading.pop(guild.id, None))
+    await asyncio.shield(task)
+    return role_indexes.get(guild.id)
+
+
+def build_ping_text(cfg: GuildConfig, tag: str) -> str:
+    roles = cfg.roles_of(tag)
     if not roles:
         return ""
     return f"<@&{roles['leader']}> <@&{roles['deputy']}>"
 
 
-def strela_already_started_from_embed(emb: discord.Embed) -> bool:
-    vremya_val = None
-    for f in emb.fields:
-        if f.name == "__strela_time__":
-            vremya_val = (f.value or "").strip()
-            break
+# ====== АВТОДОПОЛНЕНИЕ ======
+# сколько последних бизнесов из истории подсказывать
+RECENT_BIZ_LIMIT = 200
 
-    if not vremya_val:
-        return False
+# guild_id -> последние бизнесы этого сервера (у каждого сервера свои)
+biz_indexes: dict[int, PrefixIndex] = {}
 
-    try:
-        dt_target = parse_strela_time(vremya_val)
-    except Exception:
-        return False
 
-    now = datetime.now(ZoneInfo("Europe/Moscow"))
-    return now >= dt_target
+def biz_index(guild_id: int) -> PrefixIndex:
+    # только память: история из базы засевается на старте (seed_biz_indexes),
+    # сервер, добавивший бота позже, копит её с нуля
+    index = biz_indexes.get(guild_id)
+    if index is None:
+        index = biz_indexes[guild_id] = PrefixIndex(normalize_tag, capacity=RECENT_BIZ_LIMIT)
+    return index
 
-async def dm_strela_to_target_leaders(
-    interaction: discord.Interaction,
-    protiv_tag: str,
-    strela_message: discord.Message,
-):
-    guild = interaction.guild
-    if guild is None:
-        return
 
-    key = normalize_tag(protiv_tag)
-    roles_cfg = FACTION_PINGS.get(key)
-    if not roles_cfg:
-        return  # неизвестный тег
+def seed_biz_indexes(guild_ids: Iterable[int]) -> int:
+    for guild_id in guild_ids:
+        biz_index(guild_id).extend(store.recent_biz(RECENT_BIZ_LIMIT, guild_id))
+    return sum(len(index) for index in biz_indexes.values())
 
-    # Прогружаем участников (иначе role.members может быть пустым)
-    try:
-        await guild.chunk()
-    except Exception:
-        pass
 
-    role_ids = [roles_cfg["leader"], roles_cfg["deputy"]]
-    recipients = set()
+# ====== ЗАНЯТЫЕ СЛОТЫ ======
+# Стрелы одной фракции (с любой стороны) или за один бизнес не должны идти
+# ближе STRELA_SLOT_MINUTES друг к другу.
+# STRELA_CONFLICT_MODE: refuse — не создавать, warn — создать и предупредить, off — не проверять.
+STRELA_SLOT_MINUTES = int(os.getenv("STRELA_SLOT_MINUTES", "30"))
+CONFLICT_MODE = os.getenv("STRELA_CONFLICT_MODE", "refuse")
 
-    for rid in role_ids:
-        role = guild.get_role(rid)
-        if role:
-            for m in role.members:
-                if not m.bot:
-                    recipients.add(m)
+slot_index = SlotIndex(STRELA_SLOT_MINUTES * 60)
 
-    if not recipients:
-        return
 
-    dm_embed = discord.Embed(
-        title="🚨 Твоей организации забили стрелу",
-        description=(
-            "Привет! Твоей организации забили стрелу.\n\n"
-            "Вся информация и принятие тут:"
-        ),
-        color=discord.Color.orange()
-    )
-    dm_embed.add_field(
-        name="🔗 Ссылка на сообщение стрелы",
-        value=strela_message.jump_url,
-        inline=False
-    )
+def slot_keys(guild_id: int | None, tag: str, protiv: str, biz: str | None) -> list[tuple]:
+    # те же канонические ключи, что и для пингов; у каждого сервера свои слоты
+    keys = [("faction", guild_id, normalize_tag(tag)), ("faction", guild_id, normalize_tag(protiv))]
+    if biz:
+        keys.append(("biz", guild_id, normalize_tag(biz)))
+    return keys
+
+
+def index_slot(strela: Strela):
+    # отказанная стрела слот освобождает, откат — занимает снова
+    if strela.status == STATUS_REJECTED:
+        slot_index.remove(strela.message_id)
+    else:
+        slot_index.add(
+            strela.message_id,
+            strela.target.timestamp(),
+            slot_keys(strela.guild_id, strela.tag, strela.protiv, strela.biz),
+        )
 
-    for member in recipients:
-        try:
-            await member.send(embed=dm_embed)
-        except discord.Forbidden:
-            # ЛС закрыты
-            pass
-        except Exception:
-            pass
 
+def rebuild_slot_index() -> int:
+    slot_index.clear()
+    for row in store.load_since(time.time() - slot_index.slot):
+        index_slot(Strela.from_row(row))
+    return len(slot_index)
 
-def format_request_embed(
-    author: discord.Member,
-    tag: str,
-    protiv: str,
-    vremya: str,
-    lokaciya: str,
-    oruzhie: str,
-    biz: str | None = None,
-    status: str = "🟠 Ожидает ответа",
-    accepted_by: discord.Member | None = None,
-    size: str | None = None,
-) -> discord.Embed:
-    e = discord.Embed(
-        title="Christmas Illegals",
-        color=discord.Color.orange() if accepted_by is None else discord.Color.green(),
-        description=""
-    )
 
+def describe_conflicts(strela_ids: list[int]) -> str:
     lines = []
-    lines.append(
-        f"⚔️ **ЗАБИВ СТРЕЛЫ**\n"
-        f"┌ 🏴 Фракция: **`{tag.upper()}`**\n"
-        f"└ 🎯 Против: **`{protiv.upper()}`**"
+    for strela_id in strela_ids:
+        other = get_strela(strela_id)
+        if other is None:
+            lines.append("• стрела, которая создаётся прямо сейчас")
+        else:
+            biz = f" за `{other.biz}`" if other.biz else ""
+            lines.append(
+                f"• `{other.tag.upper()}` → `{other.protiv.upper()}`{biz}, "
+                f"🕒 `{other.vremya}` — {other.jump_url}"
+            )
+    return "\n".join(lines)
+
+
+def get_strela(message_id: int) -> Strela | None:
+    strela = strelas.get(message_id)
+    if strela is None:
+        # закрытую стрелу (например, откат после начала) читаем с диска и в памяти не держим
+        row = store.get(message_id)
+        if row is not None:
+            strela = Strela.from_row(row)
+    return strela
+
+
+# ====== СООБЩЕНИЯ ДО ХРАНИЛИЩА ======
+# У стрел, отправленных до появления базы, строки в strelas нет — запись один раз
+# восстанавливаем из их embed (по служебному полю __strela_time__), дальше как обычно.
+LEGACY_FIELD_RE = re.compile(r"(?P<name>Фракция|Против|Бизнес|Время|Локация|Оружие):\s*\*\*`(?P<value>[^`]*)`\*\*")
+LEGACY_MARK_RE = re.compile(r"<@!?(?P<id>\d+)>(?:\s*\((?P<at>\d{2}\.\d{2}\.\d{4} \d{2}:\d{2}) МСК\))?")
+
+
+def legacy_mark(value: str | None) -> tuple[int | None, float | None]:
+    # "<@id> (25.02.2026 21:10 МСК)" -> (id, ts)
+    m = LEGACY_MARK_RE.search(value or "")
+    if m is None:
+        return None, None
+    at = None
+    if m["at"]:
+        at = datetime.strptime(m["at"], "%d.%m.%Y %H:%M").replace(tzinfo=MSK).timestamp()
+    return int(m["id"]), at
+
+
+def strela_from_legacy_message(message: discord.Message) -> Strela | None:
+    if not message.embeds:
+        return None
+    emb = message.embeds[0]
+    fields = {f.name: (f.value or "").strip() for f in emb.fields}
+    vremya = fields.get("__strela_time__")
+    if not vremya:
+        return None
+
+    desc = {m["name"]: m["value"] for m in LEGACY_FIELD_RE.finditer(emb.description or "")}
+    author_id, _ = legacy_mark(fields.get("Автор"))
+    if author_id is None or "Фракция" not in desc or "Против" not in desc:
+        return None
+
+    created = message.created_at.astimezone(MSK)
+    try:
+        # "21:10" считалось от момента отправки, а не от сегодняшнего дня
+        target = parse_strela_time(vremya, now=created)
+    except ValueError:
+        return None
+
+    # теги в embed в верхнем регистре, в записи — как ввели; для поиска ролей это одно и то же
+    komu = fields.get("Кому", "")
+    strela = Strela(
+        message_id=message.id,
+        guild_id=message.guild.id if message.guild else None,
+        channel_id=message.channel.id,
+        author_id=author_id,
+        tag=desc["Фракция"].lower(),
+        protiv=desc["Против"].lower(),
+        biz=desc.get("Бизнес"),
+        vremya=vremya,
+        lokaciya=desc.get("Локация", ""),
+        oruzhie=desc.get("Оружие", ""),
+        ping_to=komu if komu.startswith("<@&") else "",
+        target=target,
+        created_at=created.timestamp(),
     )
 
-    if biz:
-        lines.append(f"🏢 Бизнес: **`{biz}`**")
+    status = next((v for name, v in fields.items() if "Статус" in name), "")
+    if "Принято" in status:
+        user_id, at = legacy_mark(fields.get("✅ Принял"))
+        strela.accept(user_id, fields.get("👥 Количество"), at)
+    elif "Отказано" in status:
+        user_id, at = legacy_mark(fields.get("❌ Отказал"))
+        strela.reject(user_id, at)
+    return strela
+
+
+def adopt_legacy_strela(message: discord.Message) -> Strela | None:
+    strela = strela_from_legacy_message(message)
+    if strela is None:
+        return None
+
+    now = datetime.now(MSK)
+    # прежний отсчёт умер вместе с процессом, который отправил сообщение
+    strela.is_open = not strela.started(now)
+    store.add(strela.message_id, **strela.row_fields())
+    print(f"LEGACY: стрела {strela.message_id} перенесена в базу")
+    if strela.is_open:
+        strelas[strela.message_id] = strela
+        index_slot(strela)
+        announce_strela(strela)
+        start_countdown(strela)
+        touch_board(strela.channel_id)
+    return strela
+
+
+def dm_strela_to_target_leaders(interaction: discord.Interaction, strela: Strela):
+    # только ставит рассылку в очередь — сами ЛС уходят в фоне через dm_fanout
+    if interaction.guild is None:
+        return
+
+    cfg = config.get(interaction.guild_id)
+    roles_cfg = cfg.roles_of(strela.protiv) if cfg else None
+    if not roles_cfg:
+        return  # неизвестный тег
+
+    index = role_indexes.get(interaction.guild_id)
+    if index is None:
+        # индекса ещё нет (lean-режим, первая стрела) — догружаем держателей ролей в фоне
+        run_in_background(dm_after_role_index(interaction.guild, roles_cfg, strela))
+        return
+
+    submit_leader_dms(index, roles_cfg, strela)
+
+
+async def dm_after_role_index(guild: discord.Guild, roles_cfg: dict, strela: Strela):
+    try:
+        index = await ensure_role_index(guild)
+    except (discord.HTTPException, asyncio.TimeoutError) as e:
+        print("ROLE INDEX ERROR:", e)
+        ERRORS.inc("role_index")
+        return
+    if index is not None:
+        submit_leader_dms(index, roles_cfg, strela)
+
+
+def leader_recipients(index: RoleIndex, roles_cfg: dict) -> set[int]:
+    # получателей берём из индекса ролей — без guild.chunk() на каждую стрелу
+    return index.members_of(roles_cfg["leader"]) | index.members_of(roles_cfg["deputy"])
+
 
-    lines.append(f"🕒 Время: **`{vremya}`**")
-    lines.append(f"📍 Локация: **`{lokaciya}`**")
-    lines.append(f"🔫 Оружие: **`{oruzhie}`**")
-    e.description = "\n".join(lines)
+def digest_item(strela: Strela) -> tuple[str, str, str]:
+    return strela.tag, strela.vremya, strela.jump_url
 
-    e.add_field(name="Автор", value=author.mention, inline=True)
-    e.add_field(name="Статус", value=status, inline=True)
 
-    if accepted_by:
-        e.add_field(name="✅ Принял", value=accepted_by.mention, inline=False)
-    if size:
-        e.add_field(name="👥 Количество", value=size, inline=False)
+def submit_leader_dms(index: RoleIndex, roles_cfg: dict, strela: Strela):
+    recipients = leader_recipients(index, roles_cfg)
+    if recipients:
+        queue_leader_dms([(recipients, digest_item(strela))])
 
-    e.set_footer(text="Кнопки ниже: принять / отказать / откат")
-    return e
+
+def queue_leader_dms(entries: list[tuple[set[int], tuple]]):
+    # ЛС шлёт тот процесс, что владеет окном склейки: при разделении — воркер
+    if GATEWAY_ONLY:
+        store.bus_put("dm", {"entries": [[sorted(users), item] for users, item in entries]})
+    else:
+        dm_digest.extend(entries)
 
 
 # ====== MODAL ДЛЯ ВВОДА КОЛИЧЕСТВА ======
 class SizeModal(discord.ui.Modal, title="Принять стрелу: количество"):
     size = discord.ui.TextInput(
-        label="Количество (2x2 / 3x3 / 4x4 / 5x5)",
+        label="Количество",
         placeholder="Например: 3x3",
         required=True,
         max_length=5
     )
 
-    def __init__(self, parent_view: "RequestView"):
-        super().__init__()
-        self.parent_view = parent_view
+    def __init__(self, sizes: Iterable[str] = ()):
+        # без таймаута брошенные модалки так и висели бы в памяти
+        super().__init__(timeout=300)
+
+        # составы у каждого сервера свои (guilds.json) — подпись собираем под сервер
+        sizes = sorted(sizes, key=lambda s: (len(s), s))
+        if sizes:
+            label = f"Количество ({' / '.join(sizes)})"
+            if len(label) <= 45:  # длиннее Discord подпись не примет
+                self.size.label = label
+            self.size.placeholder = f"Например: {sizes[0]}"
+            self.size.max_length = max(5, *(len(s) for s in sizes))
 
     async def on_submit(self, interaction: discord.Interaction):
         val = normalize_tag(str(self.size.value))
         val = val.replace("х", "x")
 
-        if val not in ALLOWED_SIZES:
+        cfg = config.get(interaction.guild_id)
+        sizes = cfg.sizes if cfg else frozenset()
+        if val not in sizes:
             await interaction.response.send_message(
-                "❌ Неверный формат. Разрешено только: 2x2, 3x3, 4x4, 5x5",
+                f"❌ Неверный формат. Разрешено только: {', '.join(sorted(sizes))}",
                 ephemeral=True
             )
             return
 
-        await self.parent_view.accept_with_size(interaction, val)
+        with timed(INTERACTION_SECONDS, "size"):
+            await run_locked(interaction, accept_with_size, val)
 
 
-# ====== VIEW С КНОПКАМИ ======
-class RequestView(discord.ui.View):
-    def __init__(self, author_id: int):
-        super().__init__(timeout=None)
-        self.author_id = author_id
-        self.accepted_by_id = None
-        self.size = None
-        self.rejected_by_id = None
-
-    def lock_if_finished(self):
-        if self.accepted_by_id or self.rejected_by_id:
-            for child in self.children:
-                if isinstance(child, discord.ui.Button):
-                    if child.custom_id == "req_rollback":
-                        child.disabled = False
-                    else:
-                        child.disabled = True
-
-    async def accept_with_size(self, interaction: discord.Interaction, size: str):
-        self.accepted_by_id = interaction.user.id
-        self.size = size
-        self.rejected_by_id = None
-
-        msk_time = datetime.now(ZoneInfo("Europe/Moscow")).strftime("%d.%m.%Y %H:%M")
-
-        msg = interaction.message
-        old = msg.embeds[0]
-
-        new = discord.Embed(
-            title=old.title,
-            description=old.description,
-            color=discord.Color.green()
-        )
+# ====== КНОПКИ ======
+# Кнопки без состояния: одна регистрация на все стрелы (add_dynamic_items),
+# а кто автор / кто принял берётся из хранилища по id сообщения.
+# custom_id прежние (req_accept / req_reject / req_rollback): у сообщений, отправленных
+# до хранилища, запись при первом клике восстанавливается из embed (adopt_legacy_strela).
+STRELA_BUTTONS = {
+    "accept":   ("✅ Принять", discord.ButtonStyle.success),
+    "reject":   ("❌ Отказать", discord.ButtonStyle.danger),
+    "rollback": ("↩️ Откат", discord.ButtonStyle.secondary),
+}
 
-        for f in old.fields:
-            if f.name in {"✅ Принял", "👥 Количество", "❌ Отказал"}:
-                continue
 
-            if "Статус" in f.name:
-                new.add_field(name="📊 Статус", value="🟢 Принято", inline=True)
+class StrelaButton(discord.ui.DynamicItem[discord.ui.Button], template=r"req_(?P<action>accept|reject|rollback)"):
+    def __init__(self, action: str, disabled: bool = False):
+        label, style = STRELA_BUTTONS[action]
+        super().__init__(
+            discord.ui.Button(label=label, style=style, custom_id=f"req_{action}", disabled=disabled)
+        )
+        self.action = action
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match["action"])
+
+    async def callback(self, interaction: discord.Interaction):
+        with timed(INTERACTION_SECONDS, self.action):
+            if self.action == "accept":
+                await run_locked(interaction, accept)
+            elif self.action == "reject":
+                await run_locked(interaction, reject)
             else:
-                new.add_field(name=f.name, value=f.value, inline=f.inline)
+                await run_locked(interaction, rollback)
 
-        new.add_field(
-            name="✅ Принял",
-            value=f"{interaction.user.mention} ({msk_time} МСК)",
-            inline=False
-        )
 
-        new.add_field(name="👥 Количество", value=size, inline=False)
+class RequestView(discord.ui.View):
+    def __init__(self, finished: bool = False):
+        super().__init__(timeout=None)
+        # после принятия/отказа доступен только откат
+        for action in STRELA_BUTTONS:
+            self.add_item(StrelaButton(action, disabled=finished and action != "rollback"))
 
-        new.set_footer(text="Используйте кнопки ниже")
 
-        self.lock_if_finished()
-        await msg.edit(embed=new, view=self)
+bot.add_dynamic_items(StrelaButton)
 
-        await interaction.response.send_message(f"✅ Принято {size}", ephemeral=True)
 
-    @discord.ui.button(label="✅ Принять", style=discord.ButtonStyle.success, custom_id="req_accept")
-    async def accept(self, interaction: discord.Interaction, button: discord.ui.Button):
-        emb = interaction.message.embeds[0]
-        if strela_already_started_from_embed(emb):
-            await interaction.response.send_message(
-                "❌ Нельзя принять — стрела уже началась.",
-                ephemeral=True
-            )
-            return
+# ====== СЕРИАЛИЗАЦИЯ ИЗМЕНЕНИЙ ОДНОЙ СТРЕЛЫ ======
+class StrelaBusy(Exception):
+    pass
 
-        await interaction.response.send_modal(SizeModal(self))
 
-    @discord.ui.button(label="❌ Отказать", style=discord.ButtonStyle.danger, custom_id="req_reject")
-    async def reject(self, interaction: discord.Interaction, button: discord.ui.Button):
-        emb = interaction.message.embeds[0]
-        if strela_already_started_from_embed(emb):
-            await interaction.response.send_message(
-                "❌ Нельзя отказать — стрела уже началась.",
-                ephemeral=True
-            )
-            return
+# id сообщения -> [lock, сколько корутин его держат/ждут]; запись живёт, только пока нужна
+strela_locks: dict[int, list] = {}
+
+# сколько клик может ждать чужое изменение, прежде чем получить отказ (дедлайн ответа — 3 сек)
+CLICK_LOCK_TIMEOUT = 1.0
 
-        msk_time = datetime.now(ZoneInfo("Europe/Moscow")).strftime("%d.%m.%Y %H:%M")
 
-        self.rejected_by_id = interaction.user.id
-        self.accepted_by_id = None
-        self.size = None
+@contextlib.asynccontextmanager
+async def strela_lock(message_id: int, timeout: float | None = None):
+    """
+    Все изменения одной стрелы (кнопки и тик отсчёта) идут строго по очереди,
+    разные стрелы друг друга не ждут. При timeout бросает StrelaBusy.
+    """
+    entry = strela_locks.get(message_id)
+    if entry is None:
+        entry = strela_locks[message_id] = [asyncio.Lock(), 0]
+    entry[1] += 1
 
-        msg = interaction.message
-        old = msg.embeds[0]
+    try:
+        try:
+            await asyncio.wait_for(entry[0].acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise StrelaBusy() from None
 
-        new = discord.Embed(
-            title=old.title,
-            description=old.description,
-            color=discord.Color.red()
+        try:
+            yield
+        finally:
+            entry[0].release()
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del strela_locks[message_id]
+
+
+async def run_locked(interaction: discord.Interaction, handler, *args):
+    # состояние читаем уже под замком: предыдущий клик мог его только что поменять
+    message_id = interaction.message.id
+    try:
+        async with strela_lock(message_id, timeout=CLICK_LOCK_TIMEOUT):
+            strela = get_strela(message_id) or adopt_legacy_strela(interaction.message)
+            if strela is None:
+                await interaction.response.send_message(
+                    "❌ Эта стрела не найдена в базе.",
+                    ephemeral=True
+                )
+                return
+
+            await handler(interaction, strela, *args)
+    except StrelaBusy:
+        await interaction.response.send_message(
+            "⏳ Стрелу сейчас обновляют, попробуйте ещё раз.",
+            ephemeral=True
         )
 
-        for f in old.fields:
-            if f.name in {"✅ Принял", "👥 Количество", "❌ Отказал"}:
-                continue
 
-            if "Статус" in f.name:
-                new.add_field(name="📊 Статус", value="🔴 Отказано", inline=True)
-            else:
-                new.add_field(name=f.name, value=f.value, inline=f.inline)
+async def reply_already_handled(interaction: discord.Interaction):
+    # кнопка нажата по устаревшему виду сообщения — ничего не правим
+    await interaction.response.send_message(
+        "❌ На эту стрелу уже ответили. Сначала сделайте откат.",
+        ephemeral=True
+    )
 
-        new.add_field(
-            name="❌ Отказал",
-            value=f"{interaction.user.mention} ({msk_time} МСК)",
-            inline=False
+
+async def reply_cannot_accept_started(interaction: discord.Interaction):
+    await interaction.response.send_message(
+        "❌ Нельзя принять — стрела уже началась.",
+        ephemeral=True
+    )
+
+
+async def apply_transition(
+    interaction: discord.Interaction,
+    strela: Strela,
+    transition,
+    *args,
+    finished: bool,
+):
+    # переход + одна правка сообщения; если Discord её не принял — состояние возвращаем
+    prev = strela.state_fields()
+    now = datetime.now(MSK)
+    transition(*args)
+
+    try:
+        # edit_message — это и ответ на взаимодействие, и правка сообщения одним запросом
+        await interaction.response.edit_message(
+            embed=strela.render(now),
+            view=RequestView(finished=finished),
         )
+    except Exception:
+        strela.restore_state(prev)
+        raise
 
-        new.set_footer(text=old.footer.text if old.footer else "")
+    strela.shown_key = strela.render_key(now)
+    store.update(strela.message_id, **strela.state_fields())
+    record_transition(store, strela, prev, now.timestamp(), interaction.user.id)
+    announce_strela(strela)
+    index_slot(strela)
+    touch_board(strela.channel_id)
 
-        self.lock_if_finished()
-        await msg.edit(embed=new, view=self)
 
-        await interaction.response.send_message("❌ Отказано.", ephemeral=True)
+async def accept_with_size(interaction: discord.Interaction, strela: Strela, size: str):
+    if strela.status != STATUS_PENDING:
+        await reply_already_handled(interaction)
+        return
 
-    @discord.ui.button(label="↩️ Откат", style=discord.ButtonStyle.secondary, custom_id="req_rollback")
-    async def rollback(self, interaction: discord.Interaction, button: discord.ui.Button):
-        allowed = {self.author_id, self.accepted_by_id, self.rejected_by_id}
-        allowed.discard(None)
+    # модалка живёт до 5 минут: за это время стрела могла начаться (и закрыться без принятия)
+    now = datetime.now(MSK)
+    if strela.started(now):
+        await reply_cannot_accept_started(interaction)
+        return
 
-        if interaction.user.id not in allowed:
-            await interaction.response.send_message(
-                "❌ Откат может сделать только автор или принявший/отказавший.",
-                ephemeral=True
-            )
-            return
+    await apply_transition(
+        interaction, strela, strela.accept,
+        interaction.user.id, size, now.timestamp(),
+        finished=True,
+    )
 
-        self.accepted_by_id = None
-        self.rejected_by_id = None
-        self.size = None
+    run_in_background(interaction.followup.send(f"✅ Принято {size}", ephemeral=True))
 
-        msg = interaction.message
-        old = msg.embeds[0]
 
-        new = discord.Embed(
-            title=old.title,
-            description=old.description,
-            color=discord.Color.orange()
+async def accept(interaction: discord.Interaction, strela: Strela):
+    if strela.status != STATUS_PENDING:
+        await reply_already_handled(interaction)
+        return
+
+    if strela.started(datetime.now(MSK)):
+        await reply_cannot_accept_started(interaction)
+        return
+
+    cfg = config.get(interaction.guild_id)
+    await interaction.response.send_modal(SizeModal(cfg.sizes if cfg else ()))
+
+
+async def reject(interaction: discord.Interaction, strela: Strela):
+    if strela.status != STATUS_PENDING:
+        await reply_already_handled(interaction)
+        return
+
+    if strela.started(datetime.now(MSK)):
+        await interaction.response.send_message(
+            "❌ Нельзя отказать — стрела уже началась.",
+            ephemeral=True
         )
+        return
 
-        for f in old.fields:
-            if f.name in {"✅ Принял", "👥 Количество", "❌ Отказал"}:
-                continue
+    await apply_transition(
+        interaction, strela, strela.reject,
+        interaction.user.id, datetime.now(MSK).timestamp(),
+        finished=True,
+    )
 
-            if "Статус" in f.name:
-                new.add_field(name="Статус", value="🟠 Ожидает ответа", inline=True)
-            else:
-                new.add_field(name=f.name, value=f.value, inline=f.inline)
+    run_in_background(interaction.followup.send("❌ Отказано.", ephemeral=True))
 
-        new.set_footer(text=old.footer.text if old.footer else "")
 
-        for child in self.children:
-            if isinstance(child, discord.ui.Button):
-                child.disabled = False
+async def rollback(interaction: discord.Interaction, strela: Strela):
+    if not strela.can_rollback(interaction.user.id):
+        await interaction.response.send_message(
+            "❌ Откат может сделать только автор или принявший/отказавший.",
+            ephemeral=True
+        )
+        return
 
-        await msg.edit(embed=new, view=self)
-        await interaction.response.send_message("↩️ Откат выполнен.", ephemeral=True)
+    if strela.status == STATUS_PENDING:
+        await interaction.response.send_message("↩️ Откатывать нечего.", ephemeral=True)
+        return
+
+    await apply_transition(interaction, strela, strela.rollback, finished=False)
+
+    run_in_background(interaction.followup.send("↩️ Откат выполнен.", ephemeral=True))
 
 
 # ====== КОМАНДА СОЗДАНИЯ ЗАЯВКИ ======
 @bot.tree.command(name="strela", description="Создать забив стрелы (заявка + кнопки)")
 @app_commands.describe(
-    tag="Тег твоей фракции (кто забив): lcn/rm/trb/yakuza/warlock ...",
-    protiv="Тег фракции соперника (кому забив): lcn/rm/trb/yakuza/warlock ...",
+    tag="Тег твоей фракции (кто забив) — подсказки по мере ввода",
+    protiv="Тег фракции соперника (кому забив) — подсказки по мере ввода",
     biz="Бизнес/объект (id бизнеса)",
     vremya="Время (xx:xx)",
     oruzhie="Оружие (как напишешь)",
@@ -557,63 +973,596 @@ async def strela(
     oruzhie: str,
     lokaciya: str,
 ):
-    if interaction.channel.id not in ALLOWED_CHANNELS:
+    t0 = time.perf_counter()
+    cfg = config.get(interaction.guild_id)
+    if cfg is None or interaction.channel_id not in cfg.channels:
         await interaction.response.send_message(
             "❌ Эту команду можно использовать только в канале стрел.",
             ephemeral=True
         )
         return
 
-    ping_from = build_ping_text(tag)
-    ping_to = build_ping_text(protiv)
+    # без корректного времени стрелу не создаём: кнопкам и таймеру нужна запись в хранилище
+    try:
+        dt_target = parse_strela_time(vremya)
+    except ValueError as e:
+        await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+        return
+
+    keys = slot_keys(interaction.guild_id, tag, protiv, biz)
+    conflicts = []
+    if CONFLICT_MODE != "off":
+        conflicts = slot_index.conflicts(dt_target.timestamp(), keys)
+
+    if conflicts and CONFLICT_MODE == "refuse":
+        await interaction.response.send_message(
+            f"❌ Этот слот уже занят (ближе {STRELA_SLOT_MINUTES} мин):\n"
+            f"{describe_conflicts(conflicts)}",
+            ephemeral=True
+        )
+        return
+
+    # держим слот за собой на время отправки, чтобы параллельный /strela его не занял
+    slot_index.add(interaction.id, dt_target.timestamp(), keys)
+
+    ping_from = build_ping_text(cfg, tag)
+    ping_to = build_ping_text(cfg, protiv)
 
     content = f"**🚨 Новая стрела**\n{ping_to}"
 
-    embed = format_request_embed(
-        author=interaction.user,
+    strela = Strela(
+        message_id=0,  # станет известен после отправки
+        guild_id=interaction.guild_id,
+        channel_id=interaction.channel_id,
+        author_id=interaction.user.id,
         tag=tag,
         protiv=protiv,
+        biz=biz,
         vremya=vremya,
         lokaciya=lokaciya,
         oruzhie=oruzhie,
-        biz=biz,
-        status="🟠 Ожидает ответа",
+        ping_to=ping_to,
+        target=dt_target,
+        created_at=time.time(),
     )
 
-    embed.add_field(name="⏳ До стрелы", value="Вычисляю...", inline=False)
-    embed.add_field(name="__strela_time__", value=vremya, inline=False)
-
-    embed.add_field(name="Кому", value=(ping_to if ping_to else protiv), inline=False)
-
-    view = RequestView(author_id=interaction.user.id)
+    now = datetime.now(MSK)
+    view = RequestView()
     allowed = discord.AllowedMentions(roles=True, users=True, everyone=False)
 
-    await interaction.response.send_message(
-        content=content,
-        embed=embed,
-        view=view,
-        allowed_mentions=allowed
-    )
+    try:
+        response = await interaction.response.send_message(
+            content=content,
+            embed=strela.render(now),
+            view=view,
+            allowed_mentions=allowed
+        )
 
-    msg = await interaction.original_response()
+        # id сообщения приходит в ответе на callback — без лишнего GET, и запись
+        # появляется раньше, чем по уже видимым кнопкам успеют нажать
+        strela.message_id = response.message_id
+        strela.shown_key = strela.render_key(now)
+        store.add(strela.message_id, **strela.row_fields())
+        strelas[strela.message_id] = strela
+        index_slot(strela)
+    finally:
+        slot_index.remove(interaction.id)
+    INTERACTION_SECONDS.observe(time.perf_counter() - t0, "strela")
+
+    record_created(store, strela)
+    biz_index(interaction.guild_id).add(biz)
+
+    if conflicts:
+        run_in_background(interaction.followup.send(
+            f"⚠️ Рядом по времени уже есть стрелы:\n{describe_conflicts(conflicts)}",
+            ephemeral=True
+        ))
 
-        # ✅ Уведомление в ЛС лидеру/депути той фракции, кому забили (protiv)
     try:
-        await dm_strela_to_target_leaders(interaction, protiv, msg)
+        announce_strela(strela)
+        start_countdown(strela)
+        touch_board(strela.channel_id)
     except Exception as e:
-        print("DM NOTIFY ERROR:", e)
+        print("TIMER START ERROR:", e)
+        ERRORS.inc("timer_start")
 
+    # ✅ Уведомление в ЛС лидеру/депути той фракции, кому забили (protiv)
     try:
-        dt_target = parse_strela_time(vremya)
-        asyncio.create_task(countdown_updater(msg, dt_target))
+        dm_strela_to_target_leaders(interaction, strela)
     except Exception as e:
-        print("TIMER START ERROR:", e)
+        print("DM NOTIFY ERROR:", e)
+        ERRORS.inc("dm_notify")
+
+
+# подсказки отдаются из памяти: ни базы, ни REST внутри автодополнения
+@strela.autocomplete("tag")
+@strela.autocomplete("protiv")
+async def faction_autocomplete(interaction: discord.Interaction, current: str):
+    cfg = config.get(interaction.guild_id)
+    return cfg.faction_index.lookup(current) if cfg else []
+
+
+@strela.autocomplete("biz")
+async def biz_autocomplete(interaction: discord.Interaction, current: str):
+    if interaction.guild_id is None:
+        return []
+    return biz_index(interaction.guild_id).lookup(current)
+
+
+# ====== ПАКЕТНОЕ СОЗДАНИЕ ======
+# строка расписания: tag, protiv, biz, vremya, oruzhie, lokaciya (разделитель , ; | или таб)
+BATCH_FIELDS = ("tag", "protiv", "biz", "vremya", "oruzhie", "lokaciya")
+BATCH_MAX_ROWS = 50
+BATCH_MAX_BYTES = 64 * 1024
+BATCH_REPLY_LIMIT = 1900
+
+
+def batch_rows(raw: bytes):
+    """(номер строки в файле, ячейки) — файл читается построчно, пустые строки и # пропускаются."""
+    lines = io.TextIOWrapper(io.BytesIO(raw), encoding="utf-8-sig", errors="replace", newline="")
+
+    # разделитель — по первой содержательной строке
+    head = []
+    for line in lines:
+        head.append(line)
+        if line.strip() and not line.lstrip().startswith("#"):
+            break
+    else:
+        return
+    delimiter = next((d for d in "\t;|" if d in head[-1]), ",")
+
+    reader = csv.reader(itertools.chain(head, lines), delimiter=delimiter)
+    first = True
+    for cells in reader:
+        cells = [c.strip() for c in cells]
+        if not any(cells) or cells[0].startswith("#"):
+            continue
+        if first:
+            first = False
+            if normalize_tag(cells[0]) == BATCH_FIELDS[0]:
+                continue  # заголовок
+        yield reader.line_num, cells
+
+
+def parse_batch(interaction: discord.Interaction, cfg: GuildConfig, raw: bytes):
+    """
+    Проверяет все строки до отправки: если хоть одна плохая — не создаётся ничего.
+    Слоты строк сразу резервируются (отрицательные id), чтобы строки пакета
+    конфликтовали и друг с другом; снять их — забота вызывающего.
+    """
+    batch: list[Strela] = []
+    reserved: list[int] = []
+    errors: list[str] = []
+    warnings: list[str] = []
+    now = datetime.now(MSK)
+
+    for n, cells in batch_rows(raw):
+        if len(batch) + len(errors) >= BATCH_MAX_ROWS:
+            errors.append(f"строк больше {BATCH_MAX_ROWS} — разбей расписание на части")
+            break
+        if len(cells) != len(BATCH_FIELDS):
+            errors.append(f"строка {n}: нужно {len(BATCH_FIELDS)} полей ({', '.join(BATCH_FIELDS)}), а не {len(cells)}")
+            continue
+
+        tag, protiv, biz, vremya, oruzhie, lokaciya = cells
+        if cfg.roles_of(tag) is None or cfg.roles_of(protiv) is None:
+            errors.append(f"строка {n}: неизвестная фракция `{tag}` или `{protiv}`")
+            continue
+        if normalize_tag(tag) == normalize_tag(protiv):
+            errors.append(f"строка {n}: фракция не может забить стрелу сама себе")
+            continue
+        try:
+            dt_target = parse_strela_time(vremya)
+        except ValueError as e:
+            errors.append(f"строка {n}: {e}")
+            continue
+        if dt_target <= now:
+            errors.append(f"строка {n}: время `{vremya}` уже прошло")
+            continue
+
+        keys = slot_keys(interaction.guild_id, tag, protiv, biz)
+        if CONFLICT_MODE != "off":
+            conflicts = slot_index.conflicts(dt_target.timestamp(), keys)
+            if conflicts and CONFLICT_MODE == "refuse":
+                errors.append(f"строка {n}: слот занят (ближе {STRELA_SLOT_MINUTES} мин)")
+                continue
+            if conflicts:
+                warnings.append(f"строка {n}: рядом по времени уже есть стрелы")
+
+        reserve_id = -(interaction.id * BATCH_MAX_ROWS + len(reserved))
+        slot_index.add(reserve_id, dt_target.timestamp(), keys)
+        reserved.append(reserve_id)
+
+        batch.append(Strela(
+            message_id=0,
+            guild_id=interaction.guild_id,
+            channel_id=interaction.channel_id,
+            author_id=interaction.user.id,
+            tag=tag,
+            protiv=protiv,
+            biz=biz,
+            vremya=vremya,
+            lokaciya=lokaciya,
+            oruzhie=oruzhie,
+            ping_to=build_ping_text(cfg, protiv),
+            target=dt_target,
+            created_at=time.time(),
+        ))
+
+    return batch, reserved, errors, warnings
+
+
+def send_batch_strela(channel: discord.abc.Messageable, strela: Strela, reserve_id: int) -> asyncio.Future:
+    async def send():
+        # рендерим в момент отправки: в очереди пакет может стоять десятки секунд
+        now = datetime.now(MSK)
+        msg = await channel.send(
+            content=f"**🚨 Новая стрела**\n{strela.ping_to}",
+            embed=strela.render(now),
+            view=RequestView(),
+            allowed_mentions=discord.AllowedMentions(roles=True, users=True, everyone=False),
+        )
+
+        # регистрируем сразу, без await: по кнопкам уже отправленной стрелы могут
+        # нажать, пока остальной пакет ещё ждёт бюджета канала
+        strela.message_id = msg.id
+        strela.shown_key = strela.render_key(now)
+        store.add(strela.message_id, **strela.row_fields())
+        strelas[strela.message_id] = strela
+        index_slot(strela)
+        slot_index.remove(reserve_id)
+        record_created(store, strela)
+        announce_strela(strela)
+        biz_index(strela.guild_id).add(strela.biz)
+        start_countdown(strela)
+        touch_board(strela.channel_id)
+        return msg
+
+    # тот же бюджет канала, что и у таймеров: пакет не выбьет 429, а идёт в темпе канала
+    return outbound.submit(strela.channel_id, PRIORITY_USER, send)
+
+
+async def dm_batch_to_target_leaders(guild: discord.Guild, cfg: GuildConfig, created: list[Strela]):
+    # одно ЛС на получателя со всеми стрелами против его фракции, а не по ЛС на стрелу
+    try:
+        index = await ensure_role_index(guild)
+    except (discord.HTTPException, asyncio.TimeoutError) as e:
+        print("ROLE INDEX ERROR:", e)
+        ERRORS.inc("role_index")
+        return
+    if index is None:
+        return
+
+    # весь пакет — в окно склейки одной пачкой: у лидеров одной фракции
+    # одинаковый список, им общий embed и одна задача рассылки
+    queue_leader_dms([
+        (leader_recipients(index, cfg.roles_of(strela.protiv)), digest_item(strela))
+        for strela in created
+    ])
+
+
+def batch_summary(created: list[Strela], failed: list[str], warnings: list[str]) -> str:
+    lines = [f"✅ Создано стрел: {len(created)}"]
+    lines += [f"• `{s.tag.upper()}` → `{s.protiv.upper()}` 🕒 `{s.vremya}` — {s.jump_url}" for s in created]
+    if failed:
+        lines.append(f"❌ Не отправлено: {len(failed)}")
+        lines += failed
+    if warnings:
+        lines.append("⚠️ Предупреждения:")
+        lines += warnings
+
+    text = ""
+    for i, line in enumerate(lines):
+        if len(text) + len(line) > BATCH_REPLY_LIMIT:
+            return text + f"… и ещё {len(lines) - i} строк"
+        text += line + "\n"
+    return text
+
+
+@bot.tree.command(name="strela_batch", description="Создать несколько стрел из файла расписания (CSV)")
+@app_commands.describe(
+    schedule="CSV/текст: tag, protiv, biz, vremya, oruzhie, lokaciya — по стреле на строку"
+)
+@app_commands.guild_only()
+async def strela_batch(interaction: discord.Interaction, schedule: discord.Attachment):
+    cfg = config.get(interaction.guild_id)
+    if cfg is None or interaction.channel_id not in cfg.channels:
+        await interaction.response.send_message(
+            "❌ Эту команду можно использовать только в канале стрел.",
+            ephemeral=True
+        )
+        return
+    if schedule.size > BATCH_MAX_BYTES:
+        await interaction.response.send_message(
+            f"❌ Файл больше {BATCH_MAX_BYTES // 1024} КБ.", ephemeral=True
+        )
+        return
+
+    # скачивание и отправка пакета дольше 3 секунд — сразу подтверждаем взаимодействие
+    with timed(INTERACTION_SECONDS, "strela_batch"):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+    try:
+        raw = await schedule.read()
+    except discord.HTTPException as e:
+        await interaction.followup.send(f"❌ Не удалось скачать файл: {e}", ephemeral=True)
+        return
+
+    batch, reserved, errors, warnings = parse_batch(interaction, cfg, raw)
+    try:
+        if errors or not batch:
+            lines = errors or ["в файле нет ни одной стрелы"]
+            await interaction.followup.send(
+                ("❌ Ничего не создано:\n" + "\n".join(lines))[:BATCH_REPLY_LIMIT],
+                ephemeral=True
+            )
+            return
+
+        results = await asyncio.gather(
+            *(
+                send_batch_strela(interaction.channel, strela, reserve_id)
+                for strela, reserve_id in zip(batch, reserved)
+            ),
+            return_exceptions=True,
+        )
+    finally:
+        for reserve_id in reserved:
+            slot_index.remove(reserve_id)
+
+    created: list[Strela] = []
+    failed: list[str] = []
+    for strela, result in zip(batch, results):
+        if isinstance(result, BaseException):
+            failed.append(f"• `{strela.tag.upper()}` → `{strela.protiv.upper()}` 🕒 `{strela.vremya}`: {result}")
+            ERRORS.inc("batch_send")
+            continue
+        created.append(strela)
+
+    if created:
+        run_in_background(dm_batch_to_target_leaders(interaction.guild, cfg, created))
+
+    await interaction.followup.send(batch_summary(created, failed, warnings), ephemeral=True)
+    print(f"STRELA BATCH by {interaction.user.id}: created={len(created)} failed={len(failed)}")
+
+
+# ====== СТАТИСТИКА ======
+@bot.tree.command(name="strela_stats", description="Статистика стрел по фракциям или бизнесам")
+@app_commands.describe(period="За какой период", group="Как группировать")
+@app_commands.choices(
+    period=[app_commands.Choice(name=title, value=key) for key, (title, _) in PERIODS.items()],
+    group=[
+        app_commands.Choice(name="по фракциям", value="faction"),
+        app_commands.Choice(name="по бизнесам", value="biz"),
+    ],
+)
+@app_commands.guild_only()
+async def strela_stats(
+    interaction: discord.Interaction,
+    period: app_commands.Choice[str],
+    group: app_commands.Choice[str],
+):
+    # только готовые суммы из stats_daily — ни журнала, ни запросов к Discord
+    rows = store.load_stats(interaction.guild_id, since_day(period.value, time.time()), group.value)
+    await interaction.response.send_message(
+        embed=render_stats(rows, group.value, period.value),
+        ephemeral=True
+    )
+
+
+# ====== ПЕРЕЗАГРУЗКА НАСТРОЕК ======
+@bot.tree.command(name="strela_reload", description="Перечитать настройки каналов и ролей")
+@app_commands.default_permissions(administrator=True)
+@app_commands.guild_only()
+async def strela_reload(interaction: discord.Interaction):
+    try:
+        count = config.reload()
+    except ValueError as e:
+        # старый конфиг остаётся в силе
+        await interaction.response.send_message(f"❌ Конфиг не применён: {e}", ephemeral=True)
+        return
+
+    # состав ролей мог поменяться: из кэша пересобираем сразу, в lean-режиме — по первой стреле
+    for guild in bot.guilds:
+        if LEAN_MEMBERS:
+            role_indexes.pop(guild.id, None)
+        else:
+            await rebuild_role_index(guild)
+    for channel_id in config.all_channels():
+        touch_board(channel_id)
+    if GATEWAY_ONLY:
+        store.bus_put("reload", {})
+
+    cfg = config.get(interaction.guild_id)
+    if cfg is None:
+        summary = "для этого сервера настроек нет"
+    else:
+        summary = f"каналов: {len(cfg.channels)}, фракций: {len(cfg.factions)}"
+    await interaction.response.send_message(
+        f"✅ Настройки перечитаны (серверов в файле: {count}); {summary}.",
+        ephemeral=True
+    )
+    print(f"CONFIG RELOAD by {interaction.user.id}: {count} guild(s)")
+
+
+def start_countdown(strela: Strela):
+    if GATEWAY_ONLY:
+        # отсчёт ведёт воркер; шлюзу стрела в памяти нужна только до начала (для кнопок)
+        scheduler.schedule(strela.message_id, strela.target.timestamp(), functools.partial(forget_started, strela))
+        return
+
+    scheduler.schedule(
+        strela.message_id,
+        datetime.now(MSK).timestamp(),
+        functools.partial(countdown_tick, strela),
+    )
+
+
+async def forget_started(strela: Strela) -> None:
+    # запись в базе закроет воркер; поздний откат прочитает её через get_strela
+    strelas.pop(strela.message_id, None)
+
+
+def announce_strela(strela: Strela):
+    # шлюз -> воркер: стрела создана или сменила статус (сообщение уже перерисовано)
+    if GATEWAY_ONLY:
+        store.bus_put("strela", {"id": strela.message_id})
+
+
+def restore_strelas() -> int:
+    """
+    Поднимает таймеры открытых стрел из хранилища после рестарта.
+    Каналы не обходим и сообщения не перезапрашиваем;
+    кнопки отдельно регистрировать не нужно — они без состояния.
+    """
+    rows = store.load_open()
+
+    for row in rows:
+        strela = strelas[row["message_id"]] = Strela.from_row(row)
+        start_countdown(strela)
+
+    return len(rows)
+
+
+def command_tree_hash() -> str:
+    # хеш схемы слэш-команд в том виде, в каком она уходит в Discord при sync
+    payload = [cmd.to_dict(bot.tree) for cmd in bot.tree.get_commands()]
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def sync_commands_if_changed(force: bool = False):
+    """
+    Глобальный sync — дорогой и жёстко лимитированный эндпоинт.
+    Синхронизируем, только если схема команд изменилась с прошлого раза (или --sync).
+    """
+    key = f"tree_hash:{bot.application_id}"
+    tree_hash = command_tree_hash()
+
+    if not force and store.get_meta(key) == tree_hash:
+        print("Слэш-команды не изменились, sync пропущен")
+        return
+
+    t0 = time.monotonic()
+    await bot.tree.sync()
+    store.set_meta(key, tree_hash)
+    print(f"Слэш-команды синхронизированы за {time.monotonic() - t0:.2f} с")
+
+
+# --sync из командной строки
+FORCE_SYNC = False
+
+startup_done = False
 
 
 @bot.event
 async def on_ready():
-    await bot.tree.sync()
+    global startup_done
+
+    scheduler.start()
+    outbound.start()
+    dm_fanout.start()
+
+    # индекс ролей строим заново на каждом on_ready: после реконнекта кэш участников свежий.
+    # в lean-режиме кэша нет — индекс соберётся по первой стреле на сервере
+    if LEAN_MEMBERS:
+        role_indexes.clear()
+    else:
+        for guild in bot.guilds:
+            await rebuild_role_index(guild)
+
+    # on_ready приходит и после каждого реконнекта — стартовые шаги делаем один раз
+    if not startup_done:
+        startup_done = True
+        try:
+            await serve_metrics()
+        except OSError as e:
+            print("METRICS ERROR:", e)
+        run_in_background(watch_loop_lag())
+        watch_slow_callbacks()
+
+        print(f"Восстановлено стрел: {restore_strelas()}")
+        print(f"Занятых слотов: {rebuild_slot_index()}")
+        print(f"Бизнесов в подсказках: {seed_biz_indexes(g.id for g in bot.guilds)}")
+
+        for channel_id in {*config.all_channels(), *(s.channel_id for s in strelas.values())}:
+            touch_board(channel_id)
+
+        if not GATEWAY_ONLY:
+            wake_compaction(time.time())
+
+        # on_ready после реконнекта дерево команд не меняет — проверяем один раз
+        await sync_commands_if_changed(force=FORCE_SYNC)
+        print(f"Готов к работе за {time.monotonic() - STARTED_AT:.2f} с")
+
     print(f"Бот запущен как {bot.user}")
 
 
-bot.run(os.getenv("TOKEN"))
+@bot.event
+async def on_member_join(member: discord.Member):
+    index = role_indexes.get(member.guild.id)
+    if index is not None:
+        index.add_member(member)
+
+
+@bot.event
+async def on_raw_member_remove(payload: discord.RawMemberRemoveEvent):
+    # raw — приходит и для участников, которых нет в кэше
+    index = role_indexes.get(payload.guild_id)
+    if index is not None:
+        index.discard(payload.user.id)
+
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    index = role_indexes.get(after.guild.id)
+    if index is not None:
+        index.update_member(before, after)
+
+
+def watch_raw_members():
+    # on_member_update приходит только для участников из кэша; в lean-режиме кэш пуст,
+    # поэтому смену ролей снимаем с сырого GUILD_MEMBER_UPDATE до разбора discord.py.
+    # чанки участников по своим запросам индекс ролей забирает себе целиком
+    parsers = bot._connection.parsers
+    original_update = parsers.get("GUILD_MEMBER_UPDATE")
+    original_chunk = parsers.get("GUILD_MEMBERS_CHUNK")
+    if original_update is None or original_chunk is None:
+        return
+
+    def parse_update(data):
+        index = role_indexes.get(int(data["guild_id"]))
+        user = data.get("user") or {}
+        if index is not None and not user.get("bot"):
+            index.set_roles(int(user["id"]), data.get("roles", ()))
+        original_update(data)
+
+    def parse_chunk(data):
+        if not parse_role_index_chunk(data):
+            original_chunk(data)
+
+    parsers["GUILD_MEMBER_UPDATE"] = parse_update
+    parsers["GUILD_MEMBERS_CHUNK"] = parse_chunk
+
+
+if LEAN_MEMBERS:
+    watch_raw_members()
+
+
+def main():
+    global FORCE_SYNC
+
+    parser = argparse.ArgumentParser(description="Christmas Illegals bot")
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="синхронизировать слэш-команды, даже если их схема не менялась",
+    )
+    args = parser.parse_args()
+    FORCE_SYNC = args.sync
+
+    print(f"Цикл событий: {install_event_loop()}")
+    bot.run(os.getenv("TOKEN"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import os
+import time
+from datetime import timedelta
+from typing import Callable
+
+import discord
+from discord.utils import snowflake_time, utcnow
+
+from metrics import ERRORS
+from models import STATUS_ACCEPTED, STATUS_REJECTED
+from outbound import OutboundQueue, PRIORITY_CLEANUP
+from storage import StrelaStore
+
+# delete — удалить сообщение стрелы, collapse — свернуть в одну строку без кнопок, off — не трогать
+ARCHIVE_MODE = os.getenv("STRELA_ARCHIVE_MODE", "delete")
+# сколько закрытая стрела висит в канале после начала
+RETENTION = float(os.getenv("STRELA_RETENTION_HOURS", "24")) * 3600
+
+COMPACT_INTERVAL = 600
+COMPACT_RETRY = 30
+# за один проход — не больше стольких стрел и удалений
+COMPACT_BATCH = 500
+
+# bulk-delete: от 2 до 100 сообщений, каждое моложе 14 дней (берём с запасом)
+BULK_MAX = 100
+BULK_MAX_AGE = timedelta(days=13, hours=12)
+
+
+def collapsed_text(row) -> str:
+    if row["status"] == STATUS_ACCEPTED:
+        status = f"принята ({row['size']})"
+    elif row["status"] == STATUS_REJECTED:
+        status = "отказ"
+    else:
+        status = "без ответа"
+    biz = f" за `{row['biz']}`" if row["biz"] else ""
+    return f"🗄 Стрела `{row['tag'].upper()}` → `{row['protiv'].upper()}`{biz}, {row['vremya']} — {status}"
+
+
+class Compactor:
+    """
+    Периодическая уборка, запускается общим планировщиком:
+    закрытые стрелы старше RETENTION помечаются архивными (строка в базе остаётся)
+    и убираются из канала, а сообщения с истёкшим сроком удаляются пачками
+    через bulk-delete. Все запросы идут через очередь исходящих с низшим приоритетом.
+    """
+
+    def __init__(
+        self,
+        client: discord.Client,
+        store: StrelaStore,
+        outbound: OutboundQueue,
+        on_archived: Callable[[int], None],
+    ):
+        self.client = client
+        self.store = store
+        self.outbound = outbound
+        self.on_archived = on_archived
+        # уже отданные в очередь удаления — чтобы следующий проход их не задвоил
+        self._deleting: set[int] = set()
+
+    async def run(self) -> float:
+        now = time.time()
+        more = False
+
+        if ARCHIVE_MODE != "off":
+            more |= self._archive_expired(now)
+        more |= self._flush_deletes(now)
+
+        if more:
+            return now + 1  # упёрлись в COMPACT_BATCH — дочищаем сразу
+
+        nxt = now + COMPACT_INTERVAL
+        due = self.store.next_delete_at()
+        if due is not None:
+            # просроченные ещё в полёте или ждут повтора после ошибки — не крутимся впустую
+            nxt = min(nxt, due if due > now else now + COMPACT_RETRY)
+        return nxt
+
+    # ====== АРХИВ ======
+    def _archive_expired(self, now: float) -> bool:
+        rows = self.store.load_expired(now - RETENTION, COMPACT_BATCH)
+        if not rows:
+            return False
+
+        with self.store.transaction():
+            for row in rows:
+                if ARCHIVE_MODE == "delete":
+                    self.store.schedule_delete(row["channel_id"], row["message_id"], now)
+                else:
+                    self._collapse(row)
+            self.store.archive([row["message_id"] for row in rows], now)
+
+        for row in rows:
+            self.on_archived(row["message_id"])
+
+        print(f"COMPACT: в архив {len(rows)} стрел ({ARCHIVE_MODE})")
+        return len(rows) == COMPACT_BATCH
+
+    def _collapse(self, row):
+        message = self.client.get_partial_messageable(row["channel_id"]).get_partial_message(row["message_id"])
+        text = collapsed_text(row)
+
+        async def edit():
+            try:
+                await message.edit(content=text, embed=None, view=None)
+            except discord.NotFound:
+                pass
+            except discord.HTTPException as e:
+                print("COMPACT EDIT ERROR:", e)
+                ERRORS.inc("compact_edit")
+
+        self.outbound.submit(row["channel_id"], PRIORITY_CLEANUP, edit)
+
+    # ====== УДАЛЕНИЕ ======
+    def _flush_deletes(self, now: float) -> bool:
+        rows = self.store.due_deletes(now, COMPACT_BATCH)
+        by_channel: dict[int, list[int]] = {}
+        for row in rows:
+            if row["message_id"] not in self._deleting:
+                by_channel.setdefault(row["channel_id"], []).append(row["message_id"])
+
+        oldest_bulk = utcnow() - BULK_MAX_AGE
+        for channel_id, ids in by_channel.items():
+            self._deleting.update(ids)
+            bulk = [mid for mid in ids if snowflake_time(mid) > oldest_bulk]
+            single = [mid for mid in ids if snowflake_time(mid) <= oldest_bulk]
+
+            for i in range(0, len(bulk), BULK_MAX):
+                chunk = bulk[i:i + BULK_MAX]
+                if len(chunk) == 1:
+                    single.extend(chunk)
+                else:
+                    self.outbound.submit(channel_id, PRIORITY_CLEANUP, lambda c=channel_id, ids=chunk: self._bulk(c, ids))
+            for mid in single:
+                self.outbound.submit(channel_id, PRIORITY_CLEANUP, lambda c=channel_id, m=mid: self._single(c, [m]))
+
+        return len(rows) == COMPACT_BATCH
+
+    async def _bulk(self, channel_id: int, ids: list[int]):
+        try:
+            await self.client.http.delete_messages(channel_id, ids)
+        except discord.HTTPException:
+            # bulk отклоняется целиком (например, одно сообщение уже удалено) — по одному
+            await self._single(channel_id, ids)
+            return
+        self._done(ids)
+
+    async def _single(self, channel_id: int, ids: list[int]):
+        done = []
+        for mid in ids:
+            try:
+                await self.client.http.delete_message(channel_id, mid)
+            except (discord.NotFound, discord.Forbidden):
+                pass  # удалять нечего или нельзя — повторять бессмысленно
+            except discord.HTTPException as e:
+                print("COMPACT DELETE ERROR:", e)
+                ERRORS.inc("compact_delete")
+                self._deleting.discard(mid)  # попробуем на следующем проходе
+                continue
+            done.append(mid)
+        self._done(done)
+
+    def _done(self, ids: list[int]):
+        self.store.drop_deletes(ids)
+        self._deleting.difference_update(ids)
@@ -0,0 +1,73 @@
+from typing import Callable, Iterable
+
+from discord import app_commands
+
+# больше 25 вариантов Discord всё равно не покажет
+MAX_CHOICES = 25
+
+
+class PrefixIndex:
+    """
+    Готовые ответы автодополнения: префикс -> список Choice.
+    Таблица считается заранее при добавлении значения, поэтому ответ на
+    запрос — один поиск в словаре, без перебора и без похода в базу.
+    Свежедобавленные значения идут первыми.
+    С capacity помнит только столько последних разных значений:
+    самое старое вытесняется вместе со своими префиксами.
+    """
+
+    def __init__(
+        self,
+        normalize: Callable[[str], str],
+        limit: int = MAX_CHOICES,
+        capacity: int | None = None,
+    ):
+        self.normalize = normalize
+        self.limit = limit
+        self.capacity = capacity
+        self._table: dict[str, list[app_commands.Choice[str]]] = {}
+        # нормализованные значения от старых к новым (для вытеснения)
+        self._recent: dict[str, None] = {}
+
+    def __len__(self) -> int:
+        # сколько разных значений помнит индекс
+        return len(self._recent)
+
+    def add(self, value: str):
+        key = self.normalize(value)
+        if not key:
+            return
+
+        choice = app_commands.Choice(name=value[:100], value=value[:100])
+        for i in range(len(key) + 1):
+            lst = self._table.setdefault(key[:i], [])
+            for j, old in enumerate(lst):
+                if self.normalize(old.value) == key:
+                    del lst[j]
+                    break
+            lst.insert(0, choice)
+            del lst[self.limit:]
+
+        self._recent.pop(key, None)
+        self._recent[key] = None
+        if self.capacity is not None and len(self._recent) > self.capacity:
+            self._evict(next(iter(self._recent)))
+
+    def _evict(self, key: str):
+        # вытесняется самое старое значение — во всех списках оно последнее
+        del self._recent[key]
+        for i in range(len(key) + 1):
+            lst = self._table.get(key[:i])
+            if lst is None:
+                continue
+            lst[:] = [c for c in lst if self.normalize(c.value) != key]
+            if not lst:
+                del self._table[key[:i]]
+
+    def extend(self, values: Iterable[str]):
+        # values — от старых к новым, чтобы новые оказались в начале
+        for value in values:
+            self.add(value)
+
+    def lookup(self, text: str) -> list[app_commands.Choice[str]]:
+        return self._table.get(self.normalize(text), [])
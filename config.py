@@ -0,0 +1,92 @@
+import json
+import os
+import re
+from typing import Iterable
+
+from completion import PrefixIndex
+
+CONFIG_PATH = os.getenv("STRELA_CONFIG", "guilds.json")
+
+# секция для серверов, у которых нет своей
+DEFAULT_KEY = "default"
+
+
+def normalize_tag(text: str) -> str:
+    return re.sub(r"\s+", "", text.strip().lower())
+
+
+class GuildConfig:
+    """
+    Настройки одного сервера: каналы стрел, роли фракций, допустимые составы.
+    Неизменяема после создания — при перезагрузке собирается новая.
+    """
+
+    __slots__ = ("channels", "factions", "sizes", "role_ids", "faction_index")
+
+    def __init__(self, channels: Iterable[int], factions: dict, sizes: Iterable[str]):
+        self.channels = frozenset(int(cid) for cid in channels)
+        self.factions = {
+            normalize_tag(tag): {"leader": int(roles["leader"]), "deputy": int(roles["deputy"])}
+            for tag, roles in factions.items()
+        }
+        self.sizes = frozenset(normalize_tag(s) for s in sizes)
+
+        self.role_ids = frozenset(
+            rid for roles in self.factions.values() for rid in (roles["leader"], roles["deputy"])
+        )
+        self.faction_index = PrefixIndex(normalize_tag)
+        self.faction_index.extend(reversed(self.factions))  # в порядке настроек
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GuildConfig":
+        try:
+            return cls(data["channels"], data["factions"], data["sizes"])
+        except KeyError as e:
+            raise ValueError(f"нет поля {e}") from None
+        except (TypeError, ValueError, AttributeError) as e:
+            raise ValueError(str(e)) from None
+
+    def roles_of(self, tag: str) -> dict | None:
+        return self.factions.get(normalize_tag(tag))
+
+
+class ConfigStore:
+    """
+    Конфиг всех серверов из JSON-файла, целиком в памяти.
+    reload() сначала разбирает файл полностью и только потом одной
+    подменой словаря делает его текущим: при ошибке остаётся старый конфиг.
+    """
+
+    def __init__(self, path: str = CONFIG_PATH):
+        self.path = path
+        self._guilds: dict[str, GuildConfig] = {}
+        self._channels: frozenset[int] = frozenset()
+        self.reload()
+
+    def reload(self) -> int:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"не удалось прочитать {self.path}: {e}") from None
+
+        if not isinstance(raw, dict):
+            raise ValueError(f"{self.path}: ожидается объект {{guild_id: настройки}}")
+
+        guilds = {}
+        for key, data in raw.items():
+            try:
+                guilds[key] = GuildConfig.from_dict(data)
+            except ValueError as e:
+                raise ValueError(f"{self.path}, сервер {key}: {e}") from None
+
+        self._guilds = guilds
+        self._channels = frozenset(cid for cfg in guilds.values() for cid in cfg.channels)
+        return len(guilds)
+
+    def get(self, guild_id: int | None) -> GuildConfig | None:
+        guilds = self._guilds
+        return guilds.get(str(guild_id)) or guilds.get(DEFAULT_KEY)
+
+    def all_channels(self) -> frozenset[int]:
+        return self._channels
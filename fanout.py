@@ -0,0 +1,184 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Callable, Hashable, Iterable
+
+import discord
+
+from metrics import DM_FANOUT_SECONDS, DM_RESULTS
+from ratelimit import TokenBucket
+from storage import StrelaStore
+
+# сколько держим отметку "ЛС закрыты", прежде чем попробовать снова (сек)
+DM_CLOSED_TTL = 24 * 3600
+
+
+@dataclass
+class FanoutReport:
+    label: str
+    sent: int = 0
+    closed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    latency: float = 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"DM FANOUT {self.label}: sent={self.sent} closed={self.closed} "
+            f"failed={self.failed} skipped={self.skipped} latency={self.latency:.2f}s"
+        )
+
+
+class DMFanout:
+    """
+    Фоновая рассылка ЛС: очередь задач, ограниченная параллельность,
+    кэш id DM-каналов и список получателей с закрытыми ЛС.
+    Работает только по id пользователей — объекты участников не нужны.
+    """
+
+    def __init__(
+        self,
+        client: discord.Client,
+        store: StrelaStore,
+        concurrency: int = 5,
+        rate: int = 20,
+        per: float = 1.0,
+    ):
+        self.client = client
+        self.store = store
+        self._queue: asyncio.Queue[tuple[list[int], discord.Embed, str, float]] = asyncio.Queue()
+        self._slots = asyncio.Semaphore(concurrency)
+        # общий темп, чтобы не выбивать глобальный лимит; бакеты отдельных
+        # маршрутов (у каждого DM-канала свой) discord.py соблюдает сам
+        self._bucket = TokenBucket(rate, per)
+        self._task: asyncio.Task | None = None
+        self._inflight: set[asyncio.Task] = set()
+
+        self._dm_channels: dict[int, int] = {}
+        self._closed: dict[int, float] = {}
+        for row in store.load_dm_recipients():
+            if row["channel_id"]:
+                self._dm_channels[row["user_id"]] = row["channel_id"]
+            if row["closed_at"]:
+                self._closed[row["user_id"]] = row["closed_at"]
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, user_ids: Iterable[int], embed: discord.Embed, label: str):
+        self._queue.put_nowait((list(user_ids), embed, label, time.perf_counter()))
+
+    async def _run(self):
+        while True:
+            user_ids, embed, label, queued_at = await self._queue.get()
+            task = asyncio.create_task(self._deliver(user_ids, embed, label, queued_at))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _deliver(self, user_ids: list[int], embed: discord.Embed, label: str, queued_at: float):
+        report = FanoutReport(label)
+        now = time.time()
+
+        targets = []
+        for uid in user_ids:
+            closed_at = self._closed.get(uid)
+            if closed_at and now - closed_at < DM_CLOSED_TTL:
+                report.skipped += 1
+            else:
+                targets.append(uid)
+
+        results = await asyncio.gather(*(self._send_one(uid, embed) for uid in targets))
+        for res in results:
+            setattr(report, res, getattr(report, res) + 1)
+            DM_RESULTS.inc(res)
+        if report.skipped:
+            DM_RESULTS.inc("skipped", value=report.skipped)
+
+        report.latency = time.perf_counter() - queued_at
+        DM_FANOUT_SECONDS.observe(report.latency)
+        print(report)
+        return report
+
+    async def _send_one(self, user_id: int, embed: discord.Embed) -> str:
+        async with self._slots:
+            try:
+                channel_id = self._dm_channels.get(user_id)
+                if channel_id is None:
+                    await self._bucket.take()
+                    data = await self.client.http.start_private_message(user_id)
+                    channel_id = int(data["id"])
+                    self._dm_channels[user_id] = channel_id
+                    self.store.save_dm_channel(user_id, channel_id)
+
+                channel = self.client.get_partial_messageable(
+                    channel_id, type=discord.ChannelType.private
+                )
+                await self._bucket.take()
+                await channel.send(embed=embed)
+
+            except discord.Forbidden:
+                # ЛС закрыты — не долбимся в них до истечения DM_CLOSED_TTL
+                self._closed[user_id] = time.time()
+                self.store.set_dm_closed(user_id, self._closed[user_id])
+                return "closed"
+            except Exception as e:
+                print("DM SEND ERROR:", user_id, e)
+                return "failed"
+
+            if self._closed.pop(user_id, None) is not None:
+                self.store.set_dm_closed(user_id, None)
+            return "sent"
+
+
+class DMDigest:
+    """
+    Окно склейки уведомлений: первое уведомление открывает окно на window секунд,
+    всё, что пришло за это время, уходит одним ЛС на получателя.
+    Получатели с одинаковым набором уведомлений получают общий embed
+    и одну задачу рассылки. Задержка ЛС — не больше window.
+    """
+
+    def __init__(
+        self,
+        fanout: DMFanout,
+        render: Callable[[list], discord.Embed],
+        window: float,
+    ):
+        self.fanout = fanout
+        self.render = render
+        self.window = window
+        self._pending: dict[int, list] = {}
+        self._timer: asyncio.TimerHandle | None = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, user_ids: Iterable[int], item: Hashable):
+        self.extend([(user_ids, item)])
+
+    def extend(self, entries: Iterable[tuple[Iterable[int], Hashable]]):
+        # пачка уведомлений склеивается между собой даже при window=0
+        for user_ids, item in entries:
+            for uid in user_ids:
+                items = self._pending.setdefault(uid, [])
+                if item not in items:
+                    items.append(item)
+
+        if self.window <= 0:
+            self.flush()
+        elif self._pending and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        groups: dict[tuple, list[int]] = {}
+        for uid, items in self._pending.items():
+            groups.setdefault(tuple(items), []).append(uid)
+        self._pending.clear()
+
+        for items, user_ids in groups.items():
+            self.fanout.submit(user_ids, self.render(list(items)), label=f"digest x{len(items)}")
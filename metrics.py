@@ -0,0 +1,253 @@
+import asyncio
+import bisect
+import os
+import re
+import time
+from typing import Callable, Iterable
+
+# STRELA_METRICS_PORT=0 — не поднимать HTTP вообще
+METRICS_HOST = os.getenv("STRELA_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("STRELA_METRICS_PORT", "9108"))
+
+# секунды: от быстрых ack до долгих ретраев после 429
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, value: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + value
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """
+    Накопительные бакеты как в Prometheus; observe — бинарный поиск
+    и пара сложений, без блокировок (всё в одном event loop).
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.bounds = tuple(sorted(buckets))
+        # labels -> [счётчики по бакетам (+Inf последним), сумма]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.bounds) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.bounds, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in self._values.items():
+            acc = 0
+            for bound, count in zip(self.bounds, counts):
+                acc += count
+                yield f"{self.name}_bucket", _labels(self.labelnames, labels, f'le="{bound}"'), acc
+            acc += counts[-1]
+            yield f"{self.name}_bucket", _labels(self.labelnames, labels, 'le="+Inf"'), acc
+            yield f"{self.name}_sum", _labels(self.labelnames, labels), total
+            yield f"{self.name}_count", _labels(self.labelnames, labels), acc
+
+
+class Gauge:
+    # значение снимается функцией в момент скрейпа — на горячем пути ничего не делается
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, func: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.func = func
+
+    def samples(self):
+        yield self.name, "", self.func()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, func: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, help, func))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, labels, value in metric.samples():
+                    lines.append(f"{name}{labels} {value}")
+            except Exception as e:
+                lines.append(f"# {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ====== МЕТРИКИ БОТА ======
+INTERACTION_SECONDS = REGISTRY.histogram(
+    "strela_interaction_seconds", "Время обработки взаимодействия до ответа", ["action"]
+)
+REST_SECONDS = REGISTRY.histogram(
+    "strela_rest_request_seconds", "Задержка REST-запроса к Discord", ["method", "route"]
+)
+REST_REQUESTS = REGISTRY.counter(
+    "strela_rest_requests_total", "REST-запросы к Discord по коду ответа", ["method", "route", "status"]
+)
+REST_RATELIMITED = REGISTRY.counter(
+    "strela_rest_ratelimited_total", "Ответы 429 по маршрутам", ["method", "route"]
+)
+SCHEDULER_LATENESS = REGISTRY.histogram(
+    "strela_scheduler_lateness_seconds", "Насколько позже дедлайна сработал планировщик",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+DM_RESULTS = REGISTRY.counter("strela_dm_total", "Исходы рассылки ЛС", ["outcome"])
+DM_FANOUT_SECONDS = REGISTRY.histogram(
+    "strela_dm_fanout_seconds", "От постановки рассылки до последнего ЛС",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+LOOP_LAG = REGISTRY.histogram(
+    "strela_event_loop_lag_seconds", "Задержка пробуждения event loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+ERRORS = REGISTRY.counter("strela_errors_total", "Ошибки по месту возникновения", ["where"])
+SLOW_CALLBACKS = REGISTRY.histogram(
+    "strela_slow_callback_seconds", "Колбэки, дольше порога занявшие event loop",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+class timed:
+    """with timed(HIST, *labels): ... — наблюдение длительности блока."""
+
+    __slots__ = ("hist", "labels", "t0")
+
+    def __init__(self, hist: Histogram, *labels):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0, *self.labels)
+        return False
+
+
+# ====== REST ЧЕРЕЗ aiohttp TraceConfig ======
+# id и токены в пути схлопываем, иначе каждая стрела стала бы отдельным рядом
+_ROUTE_ID = re.compile(r"/\d{15,}")
+_ROUTE_TOKEN = re.compile(r"/(interactions|webhooks)/\{id\}/[^/]+")
+
+
+def route_of(path: str) -> str:
+    path = path.split("/api/v", 1)[-1]
+    path = path[path.find("/"):] if "/" in path else path
+    path = _ROUTE_ID.sub("/{id}", path)
+    return _ROUTE_TOKEN.sub(r"/\1/{id}/{token}", path)
+
+
+def rest_trace_config():
+    # aiohttp — зависимость discord.py, отдельно не ставится
+    import aiohttp
+
+    async def on_start(session, ctx, params):
+        ctx.t0 = time.perf_counter()
+
+    async def on_end(session, ctx, params):
+        route = route_of(params.url.path)
+        status = params.response.status
+        REST_SECONDS.observe(time.perf_counter() - ctx.t0, params.method, route)
+        REST_REQUESTS.inc(params.method, route, status)
+        if status == 429:
+            REST_RATELIMITED.inc(params.method, route)
+
+    async def on_error(session, ctx, params):
+        REST_REQUESTS.inc(params.method, route_of(params.url.path), "error")
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_start)
+    trace.on_request_end.append(on_end)
+    trace.on_request_exception.append(on_error)
+    return trace
+
+
+# ====== ФОН: ЛАГ ЦИКЛА И HTTP ======
+async def watch_loop_lag(interval: float = 0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - t0 - interval))
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request = await asyncio.wait_for(reader.readline(), timeout=5)
+        # заголовки запроса не нужны, но их надо дочитать
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", REGISTRY.render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str = METRICS_HOST, port: int = METRICS_PORT) -> asyncio.AbstractServer | None:
+    if not port:
+        return None
+    server = await asyncio.start_server(_handle, host, port)
+    print(f"Метрики: http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,276 @@
+import functools
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import discord
+
+STATUS_PENDING = "pending"
+STATUS_ACCEPTED = "accepted"
+STATUS_REJECTED = "rejected"
+
+# поля, которые меняются кнопками и пишутся обратно в хранилище
+STATE_FIELDS = ("status", "accepted_by", "accepted_at", "rejected_by", "rejected_at", "size")
+
+# одна зона на процесс: у всех datetime стрел общий tzinfo, и разность
+# двух таких datetime считается без вызовов utcoffset
+MSK = ZoneInfo("Europe/Moscow")
+
+
+def format_left(sec: int) -> str:
+    # остаток в виде "1д 02ч 05м" / "02ч 05м"; текст зависит только от целых минут
+    return _format_minutes(sec // 60)
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_minutes(total: int) -> str:
+    days, rest = divmod(total, 1440)
+    hours, mins = divmod(rest, 60)
+
+    if days > 0:
+        return f"{days}д {hours:02d}ч {mins:02d}м"
+    return f"{hours:02d}ч {mins:02d}м"
+
+
+def format_msk(ts: float) -> str:
+    return datetime.fromtimestamp(ts, MSK).strftime("%d.%m.%Y %H:%M")
+
+
+class Strela:
+    """
+    Стрела целиком в памяти: всё, что раньше вычитывалось из embed регулярками.
+    Embed только рисуется из этой записи (render) и никогда не читается обратно.
+    """
+
+    __slots__ = (
+        "message_id", "guild_id", "channel_id", "author_id",
+        "tag", "protiv", "biz", "vremya", "lokaciya", "oruzhie", "ping_to",
+        "target", "created_at", "is_open",
+        "status", "accepted_by", "accepted_at", "rejected_by", "rejected_at", "size",
+        "shown_key", "_version", "_render_key", "_render",
+    )
+
+    # режим доски: отсчёт в сообщении стрелы рисует сам клиент Discord (<t:...:R>),
+    # поэтому до начала стрелы сообщение не правится
+    board_mode = False
+
+    def __init__(
+        self,
+        message_id: int,
+        guild_id: int | None,
+        channel_id: int,
+        author_id: int,
+        tag: str,
+        protiv: str,
+        biz: str | None,
+        vremya: str,
+        lokaciya: str,
+        oruzhie: str,
+        ping_to: str,
+        target: datetime,
+        created_at: float,
+        is_open: bool = True,
+        status: str = STATUS_PENDING,
+        accepted_by: int | None = None,
+        accepted_at: float | None = None,
+        rejected_by: int | None = None,
+        rejected_at: float | None = None,
+        size: str | None = None,
+    ):
+        self.message_id = message_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.tag = tag
+        self.protiv = protiv
+        self.biz = biz
+        self.vremya = vremya
+        self.lokaciya = lokaciya
+        self.oruzhie = oruzhie
+        self.ping_to = ping_to
+        self.target = target
+        self.created_at = created_at
+        self.is_open = is_open
+        self.status = status
+        self.accepted_by = accepted_by
+        self.accepted_at = accepted_at
+        self.rejected_by = rejected_by
+        self.rejected_at = rejected_at
+        self.size = size
+        # render_key того, что сейчас видно в Discord (None — неизвестно)
+        self.shown_key = None
+        self._version = 0
+        self._render_key = None
+        self._render = None
+
+    @classmethod
+    def from_row(cls, row) -> "Strela":
+        return cls(
+            message_id=row["message_id"],
+            guild_id=row["guild_id"],
+            channel_id=row["channel_id"],
+            author_id=row["author_id"],
+            tag=row["tag"],
+            protiv=row["protiv"],
+            biz=row["biz"],
+            vremya=row["vremya"],
+            lokaciya=row["lokaciya"],
+            oruzhie=row["oruzhie"],
+            ping_to=row["ping_to"],
+            target=datetime.fromtimestamp(row["target_ts"], MSK),
+            created_at=row["created_at"],
+            is_open=bool(row["is_open"]),
+            status=row["status"],
+            accepted_by=row["accepted_by"],
+            accepted_at=row["accepted_at"],
+            rejected_by=row["rejected_by"],
+            rejected_at=row["rejected_at"],
+            size=row["size"],
+        )
+
+    def row_fields(self) -> dict:
+        # всё, кроме message_id, в виде колонок таблицы strelas
+        fields = {
+            "guild_id": self.guild_id,
+            "channel_id": self.channel_id,
+            "author_id": self.author_id,
+            "tag": self.tag,
+            "protiv": self.protiv,
+            "biz": self.biz,
+            "vremya": self.vremya,
+            "lokaciya": self.lokaciya,
+            "oruzhie": self.oruzhie,
+            "ping_to": self.ping_to,
+            "target_ts": self.target.timestamp(),
+            "created_at": self.created_at,
+            "is_open": int(self.is_open),
+        }
+        fields.update(self.state_fields())
+        return fields
+
+    def state_fields(self) -> dict:
+        return {name: getattr(self, name) for name in STATE_FIELDS}
+
+    @property
+    def jump_url(self) -> str:
+        return f"https://discord.com/channels/{self.guild_id}/{self.channel_id}/{self.message_id}"
+
+    # ====== ПЕРЕХОДЫ СОСТОЯНИЯ ======
+    def accept(self, user_id: int, size: str, at: float):
+        self.status = STATUS_ACCEPTED
+        self.accepted_by = user_id
+        self.accepted_at = at
+        self.rejected_by = None
+        self.rejected_at = None
+        self.size = size
+        self._version += 1
+
+    def reject(self, user_id: int, at: float):
+        self.status = STATUS_REJECTED
+        self.accepted_by = None
+        self.accepted_at = None
+        self.rejected_by = user_id
+        self.rejected_at = at
+        self.size = None
+        self._version += 1
+
+    def restore_state(self, fields: dict):
+        # откат перехода, если Discord не принял правку
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self._version += 1
+
+    def rollback(self):
+        self.status = STATUS_PENDING
+        self.accepted_by = None
+        self.accepted_at = None
+        self.rejected_by = None
+        self.rejected_at = None
+        self.size = None
+        self._version += 1
+
+    def can_rollback(self, user_id: int) -> bool:
+        return user_id in {self.author_id, self.accepted_by, self.rejected_by}
+
+    # ====== ОТОБРАЖЕНИЕ ======
+    def started(self, now: datetime) -> bool:
+        return now >= self.target
+
+    def timer_text(self, now: datetime) -> str:
+        left = (self.target - now).total_seconds()
+        if left <= 0:
+            if self.status == STATUS_ACCEPTED:
+                return "✅ Уже началось / прошло"
+            return "⏳ Время наступило (не принято)"
+        if self.board_mode:
+            return f"<t:{int(self.target.timestamp())}:R>"
+        return format_left(int(left))
+
+    def render_key(self, now: datetime) -> tuple:
+        # одинаковый ключ — одинаковый embed, повторно слать правку незачем
+        return (self._version, self.timer_text(now))
+
+    def render(self, now: datetime) -> discord.Embed:
+        key = self.render_key(now)
+        if key == self._render_key:
+            return self._render
+
+        if self.status == STATUS_ACCEPTED:
+            color = discord.Color.green()
+        elif self.status == STATUS_REJECTED:
+            color = discord.Color.red()
+        else:
+            color = discord.Color.orange()
+
+        lines = [
+            f"⚔️ **ЗАБИВ СТРЕЛЫ**\n"
+            f"┌ 🏴 Фракция: **`{self.tag.upper()}`**\n"
+            f"└ 🎯 Против: **`{self.protiv.upper()}`**"
+        ]
+        if self.biz:
+            lines.append(f"🏢 Бизнес: **`{self.biz}`**")
+        lines.append(f"🕒 Время: **`{self.vremya}`**")
+        lines.append(f"📍 Локация: **`{self.lokaciya}`**")
+        lines.append(f"🔫 Оружие: **`{self.oruzhie}`**")
+
+        e = discord.Embed(title="Christmas Illegals", description="\n".join(lines), color=color)
+        e.add_field(name="Автор", value=f"<@{self.author_id}>", inline=True)
+
+        if self.status == STATUS_ACCEPTED:
+            e.add_field(name="📊 Статус", value="🟢 Принято", inline=True)
+        elif self.status == STATUS_REJECTED:
+            e.add_field(name="📊 Статус", value="🔴 Отказано", inline=True)
+        else:
+            e.add_field(name="Статус", value="🟠 Ожидает ответа", inline=True)
+
+        e.add_field(name="⏳ До стрелы", value=key[1], inline=False)
+        e.add_field(name="Кому", value=self.ping_to or self.protiv, inline=False)
+
+        if self.status == STATUS_ACCEPTED:
+            e.add_field(
+                name="✅ Принял",
+                value=f"<@{self.accepted_by}> ({format_msk(self.accepted_at)} МСК)",
+                inline=False
+            )
+            e.add_field(name="👥 Количество", value=self.size, inline=False)
+            e.set_footer(text="Используйте кнопки ниже")
+        else:
+            if self.status == STATUS_REJECTED:
+                e.add_field(
+                    name="❌ Отказал",
+                    value=f"<@{self.rejected_by}> ({format_msk(self.rejected_at)} МСК)",
+                    inline=False
+                )
+            e.set_footer(text="Кнопки ниже: принять / отказать / откат")
+
+        self._render_key = key
+        self._render = e
+        return e
+
+    def notify_text(self) -> str:
+        tag = self.tag.upper()
+        protiv = self.protiv.upper()
+        if self.biz:
+            head = f"🚨 Стрела между {tag} и {protiv} за бизнес {self.biz} началась!"
+        else:
+            head = f"🚨 Стрела между {tag} и {protiv} началась!"
+        return f"{head}\n<@{self.author_id}>\n{self.ping_to or self.protiv}"
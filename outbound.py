@@ -0,0 +1,152 @@
+import asyncio
+import heapq
+import itertools
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from ratelimit import SlidingWindow
+
+# чем меньше число, тем раньше уходит запрос
+PRIORITY_NOTIFY = 0      # "🚨 Стрела ... началась!"
+PRIORITY_USER = 1        # правки и отправки по действию пользователя
+PRIORITY_COUNTDOWN = 2   # обновление таймера
+PRIORITY_CLEANUP = 3     # уборка старых сообщений
+
+# бюджет правок/отправок на канал: у Discord 5 за 5 секунд фиксированным окном;
+# окно чуть шире, чтобы разброс задержки сети не сдвинул запрос в чужое окно
+CHANNEL_RATE = 5
+CHANNEL_PER = 5.5
+
+Factory = Callable[[], Awaitable[Any]]
+
+
+class _Job:
+    __slots__ = ("factory", "future", "key")
+
+    def __init__(self, factory: Factory, future: asyncio.Future, key: Optional[Hashable]):
+        self.factory = factory
+        self.future = future
+        self.key = key
+
+
+class OutboundQueue:
+    """
+    Единая очередь исходящих запросов в каналы.
+    У каждого канала своя очередь с приоритетами и своё скользящее окно лимита;
+    общий heap хранит только "голову" каждого канала, поэтому канал,
+    упёршийся в лимит, не задерживает остальные.
+    Задачи с одинаковым coalesce_key, ещё не ушедшие в сеть, схлопываются в одну.
+    """
+
+    def __init__(self, rate: int = CHANNEL_RATE, per: float = CHANNEL_PER):
+        self.rate = rate
+        self.per = per
+        self._seq = itertools.count()
+        self._lanes: dict[int, list[tuple[int, int, _Job]]] = {}
+        self._ready: list[tuple[int, int, int]] = []
+        self._buckets: dict[int, SlidingWindow] = {}
+        self._throttled: set[int] = set()
+        self._pending: dict[Hashable, _Job] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def submit(
+        self,
+        channel_id: int,
+        priority: int,
+        factory: Factory,
+        coalesce_key: Optional[Hashable] = None,
+    ) -> asyncio.Future:
+        if coalesce_key is not None:
+            job = self._pending.get(coalesce_key)
+            if job is not None:
+                # ещё не отправлено — достаточно отправить самую свежую версию
+                job.factory = factory
+                return job.future
+
+        job = _Job(factory, asyncio.get_running_loop().create_future(), coalesce_key)
+        if coalesce_key is not None:
+            self._pending[coalesce_key] = job
+
+        seq = next(self._seq)
+        lane = self._lanes.setdefault(channel_id, [])
+        heapq.heappush(lane, (priority, seq, job))
+
+        if lane[0][1] == seq and channel_id not in self._throttled:
+            heapq.heappush(self._ready, (priority, seq, channel_id))
+            self._wakeup.set()
+
+        return job.future
+
+    def _requeue(self, channel_id: int):
+        self._throttled.discard(channel_id)
+        lane = self._lanes.get(channel_id)
+        if lane:
+            heapq.heappush(self._ready, (lane[0][0], lane[0][1], channel_id))
+            self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            self._wakeup.clear()
+
+            while self._ready:
+                priority, seq, channel_id = heapq.heappop(self._ready)
+                lane = self._lanes.get(channel_id)
+                if not lane or lane[0][1] != seq or channel_id in self._throttled:
+                    continue  # устаревшая запись
+
+                bucket = self._buckets.get(channel_id)
+                if bucket is None:
+                    bucket = self._buckets[channel_id] = SlidingWindow(self.rate, self.per)
+
+                if not bucket.try_take():
+                    # канал исчерпал бюджет — вернём его в очередь, когда освободится место в окне
+                    self._throttled.add(channel_id)
+                    loop.call_later(bucket.delay(), self._requeue, channel_id)
+                    continue
+
+                _, _, job = heapq.heappop(lane)
+                if lane:
+                    heapq.heappush(self._ready, (lane[0][0], lane[0][1], channel_id))
+                else:
+                    del self._lanes[channel_id]
+                    # окно нужно держать, пока оно не опустело, иначе бюджет обнулится
+                    loop.call_later(self.per, self._drop_bucket, channel_id)
+
+                if job.key is not None:
+                    self._pending.pop(job.key, None)
+
+                task = asyncio.create_task(self._execute(job))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+            await self._wakeup.wait()
+
+    def _drop_bucket(self, channel_id: int):
+        bucket = self._buckets.get(channel_id)
+        if bucket is None or channel_id in self._lanes or channel_id in self._throttled:
+            return
+        if bucket.full():
+            self._buckets.pop(channel_id, None)
+        else:
+            asyncio.get_running_loop().call_later(self.per, self._drop_bucket, channel_id)
+
+    async def _execute(self, job: _Job):
+        try:
+            result = await job.factory()
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+
+        if not job.future.done():
+            job.future.set_result(result)
@@ -0,0 +1,84 @@
+import asyncio
+import collections
+import time
+
+
+class TokenBucket:
+    """
+    Простое ведро токенов: не больше `rate` операций за `per` секунд.
+    Нужно, чтобы не упираться в 429, а не разгребать их после.
+    """
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / self.per)
+        self._updated = now
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def full(self) -> bool:
+        self._refill()
+        return self._tokens >= self.rate
+
+    def delay(self) -> float:
+        # сколько ждать до следующего свободного токена
+        self._refill()
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) * self.per / self.rate
+
+    async def take(self):
+        while not self.try_take():
+            await asyncio.sleep(self.delay())
+
+
+class SlidingWindow:
+    """
+    Скользящее окно: не больше `rate` операций за любые `per` секунд.
+    В отличие от TokenBucket не даёт "полное ведро + пополнение" сверх лимита,
+    поэтому подходит под фиксированные окна Discord (5 правок за 5 секунд на канал).
+    """
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self._stamps: collections.deque[float] = collections.deque()
+
+    def _expire(self, now: float):
+        while self._stamps and now - self._stamps[0] >= self.per:
+            self._stamps.popleft()
+
+    def try_take(self) -> bool:
+        now = time.monotonic()
+        self._expire(now)
+        if len(self._stamps) < self.rate:
+            self._stamps.append(now)
+            return True
+        return False
+
+    def full(self) -> bool:
+        # окно пустое — бюджет восстановлен целиком
+        self._expire(time.monotonic())
+        return not self._stamps
+
+    def delay(self) -> float:
+        now = time.monotonic()
+        self._expire(now)
+        if len(self._stamps) < self.rate:
+            return 0.0
+        return self._stamps[0] + self.per - now
+
+    async def take(self):
+        while not self.try_take():
+            await asyncio.sleep(self.delay())
@@ -0,0 +1,53 @@
+from typing import Iterable
+
+import discord
+
+
+class RoleIndex:
+    """
+    id роли -> id участников (без ботов), только для ролей из настроек.
+    Строится один раз на старте и дальше обновляется событиями участников,
+    поэтому при забиве стрелы не нужно делать guild.chunk().
+    Хранит только id — сами объекты участников держать не обязательно.
+    """
+
+    def __init__(self, role_ids: Iterable[int]):
+        self._members: dict[int, set[int]] = {rid: set() for rid in role_ids}
+
+    def members_of(self, role_id: int) -> set[int]:
+        return self._members.get(role_id, set())
+
+    def rebuild(self, members: Iterable[discord.Member]):
+        for ids in self._members.values():
+            ids.clear()
+
+        # один проход по участникам вместо role.members для каждой роли
+        for member in members:
+            self.add_member(member)
+
+    def add_member(self, member: discord.Member):
+        if member.bot:
+            return
+        # _roles — голые id ролей: member.roles строил бы и сортировал объекты Role
+        self.set_roles(member.id, member._roles)
+
+    def remove_member(self, member: discord.Member):
+        self.discard(member.id)
+
+    def update_member(self, before: discord.Member, after: discord.Member):
+        if before.roles == after.roles:
+            return
+        self.remove_member(before)
+        self.add_member(after)
+
+    # ====== по сырым данным шлюза (без объекта Member) ======
+    def set_roles(self, user_id: int, role_ids: Iterable[int]):
+        self.discard(user_id)
+        for rid in role_ids:
+            ids = self._members.get(int(rid))
+            if ids is not None:
+                ids.add(user_id)
+
+    def discard(self, user_id: int):
+        for ids in self._members.values():
+            ids.discard(user_id)
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+
+from metrics import SLOW_CALLBACKS
+
+# STRELA_FAST=1 — uvloop (если установлен: pip install uvloop) и поиск медленных колбэков
+FAST_MODE = os.getenv("STRELA_FAST") == "1"
+# порог медленного колбэка в мс; 0 — не следить (по умолчанию следим только в быстром режиме)
+SLOW_CALLBACK_MS = float(os.getenv("STRELA_SLOW_CALLBACK_MS", "100" if FAST_MODE else "0"))
+
+# сколько последних кадров стека показывать в отчёте
+SLOW_STACK_DEPTH = 6
+
+
+def install_event_loop() -> str:
+    """Вызывается до запуска цикла (bot.run / asyncio.run). Возвращает имя цикла."""
+    if not FAST_MODE:
+        return "asyncio"
+    try:
+        import uvloop
+    except ImportError:
+        print("FAST: uvloop не установлен — обычный asyncio")
+        return "asyncio"
+
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return "uvloop"
+
+
+class SlowCallbackWatchdog:
+    """
+    Сторож цикла: цикл раз в полпорога отмечается, а фоновый поток, увидев,
+    что отметки нет дольше порога, снимает стек потока цикла — это и есть
+    код, который его держит. Когда цикл освобождается, отчёт печатается
+    и попадает в гистограмму.
+
+    debug-режим asyncio (loop.slow_callback_duration) даёт то же, но замедляет
+    каждую задачу на порядок и с uvloop не работает; здесь на самом цикле
+    только один таймер.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.interval = threshold / 2
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread_id = 0
+        self._beat = 0.0
+        self._stack: list[str] | None = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self._loop is not None:
+            return
+        self._loop = loop
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        loop.call_later(self.interval, self._tick)
+        threading.Thread(target=self._watch, name="slow-callback-watchdog", daemon=True).start()
+
+    def _tick(self):
+        now = time.monotonic()
+        lag = now - self._beat - self.interval
+        stack, self._stack = self._stack, None
+        self._beat = now
+        self._loop.call_later(self.interval, self._tick)
+
+        if lag > self.threshold:
+            SLOW_CALLBACKS.observe(lag)
+            where = "".join(stack).rstrip() if stack else "  (стек снять не успели)"
+            print(f"SLOW CALLBACK: цикл занят {lag * 1000:.0f} мс, где:\n{where}")
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval / 2)
+            if self._stack is not None:
+                continue  # эту остановку уже сняли
+            if time.monotonic() - self._beat - self.interval > self.threshold:
+                frame = sys._current_frames().get(self._thread_id)
+                if frame is not None:
+                    self._stack = traceback.format_stack(frame)[-SLOW_STACK_DEPTH:]
+
+
+_watchdog: SlowCallbackWatchdog | None = None
+
+
+def watch_slow_callbacks(loop: asyncio.AbstractEventLoop | None = None):
+    global _watchdog
+    if SLOW_CALLBACK_MS <= 0 or _watchdog is not None:
+        return
+    _watchdog = SlowCallbackWatchdog(SLOW_CALLBACK_MS / 1000)
+    _watchdog.start(loop or asyncio.get_running_loop())
+    print(f"Слежу за колбэками дольше {SLOW_CALLBACK_MS:.0f} мс")
@@ -0,0 +1,95 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Hashable, Optional
+
+from metrics import ERRORS, SCHEDULER_LATENESS
+
+# callback возвращает unix-время следующего пробуждения или None — тогда ключ снимается
+Callback = Callable[[], Awaitable[Optional[float]]]
+
+
+class DeadlineScheduler:
+    """
+    Один общий планировщик вместо отдельной задачи на каждую стрелу.
+    Куча (when, seq, key): спим ровно до ближайшего дедлайна, а не опрашиваем раз в минуту.
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[float, int, Hashable]] = []
+        self._entries: dict[Hashable, tuple[float, int, Callback]] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def schedule(self, key: Hashable, when: float, callback: Callback):
+        # повторный schedule по тому же ключу просто перекрывает старую запись
+        seq = next(self._seq)
+        self._entries[key] = (when, seq, callback)
+        heapq.heappush(self._heap, (when, seq, key))
+        if self._heap[0][1] == seq:
+            self._wakeup.set()
+
+    def when(self, key: Hashable) -> Optional[float]:
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def cancel(self, key: Hashable):
+        # из кучи не удаляем — устаревшая запись отбросится при извлечении
+        self._entries.pop(key, None)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            # выкидываем отменённые / перезаписанные записи с вершины
+            while self._heap:
+                when, seq, key = self._heap[0]
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] == seq:
+                    break
+                heapq.heappop(self._heap)
+
+            self._wakeup.clear()
+
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            when, seq, key = heapq.heappop(self._heap)
+            _, _, callback = self._entries.pop(key)
+            SCHEDULER_LATENESS.observe(time.time() - when)
+
+            task = asyncio.create_task(self._fire(key, callback))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _fire(self, key: Hashable, callback: Callback):
+        try:
+            nxt = await callback()
+        except Exception as e:
+            print("SCHEDULER ERROR:", e)
+            ERRORS.inc("scheduler")
+            return
+
+        # пока callback работал, ключ могли перепланировать — тогда не трогаем
+        if nxt is not None and key not in self._entries:
+            self.schedule(key, nxt, callback)
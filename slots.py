@@ -0,0 +1,70 @@
+import bisect
+import time
+from typing import Hashable, Iterable
+
+
+class SlotIndex:
+    """
+    Занятые слоты времени по ключам (фракция / бизнес).
+    На каждый ключ — отсортированный список (начало, id стрелы), поэтому
+    пересечения ищутся бинарным поиском, без обхода всех стрел.
+    Стрела занимает [начало - slot, начало + slot): две стрелы ближе slot конфликтуют.
+    """
+
+    def __init__(self, slot: float):
+        self.slot = slot
+        self._by_key: dict[Hashable, list[tuple[float, int]]] = {}
+        self._entries: dict[int, tuple[float, tuple]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, strela_id: int) -> bool:
+        return strela_id in self._entries
+
+    def clear(self):
+        self._by_key.clear()
+        self._entries.clear()
+
+    def add(self, strela_id: int, start: float, keys: Iterable[Hashable]):
+        self.remove(strela_id)
+        keys = tuple(dict.fromkeys(keys))
+        self._entries[strela_id] = (start, keys)
+
+        horizon = time.time() - self.slot
+        for key in keys:
+            lst = self._by_key.setdefault(key, [])
+            # прошедшие слоты уже ни с чем не пересекутся — срезаем их с головы
+            stale = bisect.bisect_left(lst, (horizon, -1))
+            for old_start, old_id in lst[:stale]:
+                self._entries.pop(old_id, None)
+            del lst[:stale]
+            bisect.insort(lst, (start, strela_id))
+
+    def remove(self, strela_id: int):
+        entry = self._entries.pop(strela_id, None)
+        if entry is None:
+            return
+
+        start, keys = entry
+        for key in keys:
+            lst = self._by_key.get(key)
+            if not lst:
+                continue
+            i = bisect.bisect_left(lst, (start, strela_id))
+            if i < len(lst) and lst[i] == (start, strela_id):
+                del lst[i]
+            if not lst:
+                del self._by_key[key]
+
+    def conflicts(self, start: float, keys: Iterable[Hashable]) -> list[int]:
+        found = {}
+        for key in keys:
+            lst = self._by_key.get(key)
+            if not lst:
+                continue
+            lo = bisect.bisect_right(lst, (start - self.slot, float("inf")))
+            hi = bisect.bisect_left(lst, (start + self.slot, -1))
+            for _, strela_id in lst[lo:hi]:
+                found[strela_id] = None
+        return list(found)
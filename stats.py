@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+
+import discord
+
+from config import normalize_tag
+from models import MSK, Strela, STATUS_ACCEPTED, STATUS_REJECTED
+from storage import StrelaStore
+
+EVENT_CREATED = "created"
+EVENT_ACCEPTED = "accepted"
+EVENT_REJECTED = "rejected"
+EVENT_ROLLED_BACK = "rolled_back"
+EVENT_STARTED = "started"
+EVENT_EXPIRED = "expired"
+
+# период -> (подпись, сколько дней назад начинать; None — за всё время)
+PERIODS = {
+    "day": ("сегодня", 0),
+    "week": ("за 7 дней", 6),
+    "month": ("за 30 дней", 29),
+    "all": ("за всё время", None),
+}
+
+STATS_TEXT_LIMIT = 3900
+
+
+def stat_day(ts: float) -> str:
+    return datetime.fromtimestamp(ts, MSK).strftime("%Y-%m-%d")
+
+
+def since_day(period: str, now: float) -> str:
+    days = PERIODS[period][1]
+    if days is None:
+        return ""
+    return stat_day(now - timedelta(days=days).total_seconds())
+
+
+def team_size(size: str | None) -> int | None:
+    # "3x3" -> 3
+    try:
+        return int(size.lower().split("x", 1)[0])
+    except (AttributeError, ValueError):
+        return None
+
+
+# Забив и начало засчитываются фракции, которая забила (tag),
+# ответ (принято / отказ / откат) — фракции, которой забили (protiv).
+def _keys(strela: Strela) -> tuple[str, str, str]:
+    return normalize_tag(strela.tag), normalize_tag(strela.protiv), normalize_tag(strela.biz or "")
+
+
+def record_created(store: StrelaStore, strela: Strela):
+    tag, _, biz = _keys(strela)
+    store.log_event(
+        strela.message_id, strela.guild_id or 0, EVENT_CREATED, strela.created_at,
+        user_id=strela.author_id,
+        bumps=[(stat_day(strela.created_at), tag, biz, {"opened": 1})],
+    )
+
+
+def record_started(store: StrelaStore, strela: Strela, at: float):
+    # началась только принятая стрела; время остальных просто истекло —
+    # это пишется в журнал, но в "началось" не идёт
+    if strela.status != STATUS_ACCEPTED:
+        store.log_event(strela.message_id, strela.guild_id or 0, EVENT_EXPIRED, at)
+        return
+
+    tag, _, biz = _keys(strela)
+    store.log_event(
+        strela.message_id, strela.guild_id or 0, EVENT_STARTED, at,
+        size=strela.size,
+        bumps=[(stat_day(at), tag, biz, {"started": 1})],
+    )
+
+
+def record_transition(store: StrelaStore, strela: Strela, prev: dict, at: float, user_id: int):
+    """
+    prev — state_fields() до перехода. Откат вычитает прежний ответ из того дня,
+    когда он был дан, поэтому суммы показывают текущее состояние стрел.
+    """
+    _, protiv, biz = _keys(strela)
+    day = stat_day(at)
+
+    if strela.status == STATUS_ACCEPTED:
+        bump = {"accepted": 1}
+        n = team_size(strela.size)
+        if n is not None:
+            bump.update(size_sum=n, size_n=1)
+        store.log_event(
+            strela.message_id, strela.guild_id or 0, EVENT_ACCEPTED, at,
+            user_id=user_id, size=strela.size, bumps=[(day, protiv, biz, bump)],
+        )
+        return
+
+    if strela.status == STATUS_REJECTED:
+        store.log_event(
+            strela.message_id, strela.guild_id or 0, EVENT_REJECTED, at,
+            user_id=user_id, bumps=[(day, protiv, biz, {"rejected": 1})],
+        )
+        return
+
+    bumps = [(day, protiv, biz, {"rolled_back": 1})]
+    if prev["status"] == STATUS_ACCEPTED:
+        undo = {"accepted": -1}
+        n = team_size(prev["size"])
+        if n is not None:
+            undo.update(size_sum=-n, size_n=-1)
+        bumps.append((stat_day(prev["accepted_at"] or at), protiv, biz, undo))
+    elif prev["status"] == STATUS_REJECTED:
+        bumps.append((stat_day(prev["rejected_at"] or at), protiv, biz, {"rejected": -1}))
+
+    store.log_event(
+        strela.message_id, strela.guild_id or 0, EVENT_ROLLED_BACK, at,
+        user_id=user_id, bumps=bumps,
+    )
+
+
+def render_stats(rows, group: str, period: str) -> discord.Embed:
+    lines = []
+    size = 0
+    for i, row in enumerate(rows):
+        if group == "faction":
+            name = f"`{row['name'].upper()}`"
+        else:
+            name = f"🏢 `{row['name']}`" if row["name"] else "🏢 без бизнеса"
+
+        avg = f"{row['size_sum'] / row['size_n']:.1f}" if row["size_n"] else "—"
+        line = (
+            f"**{name}** — забито {row['opened']}, принято {row['accepted']}, "
+            f"отказов {row['rejected']}, откатов {row['rolled_back']}, "
+            f"началось {row['started']}, средний состав {avg}"
+        )
+        if size + len(line) > STATS_TEXT_LIMIT:
+            lines.append(f"… и ещё {len(rows) - i}")
+            break
+        lines.append(line)
+        size += len(line) + 1
+
+    title = "по фракциям" if group == "faction" else "по бизнесам"
+    e = discord.Embed(
+        title=f"📊 Стрелы {title} ({PERIODS[period][0]})",
+        description="\n".join(lines) if lines else "Стрел за этот период нет.",
+        color=discord.Color.blurple(),
+    )
+    e.set_footer(text="Забито и началось — у забившей фракции, ответы — у той, кому забили")
+    return e
@@ -0,0 +1,349 @@
+import contextlib
+import json
+import os
+import sqlite3
+import time
+
+DB_PATH = os.getenv("STRELA_DB", "strela.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS strelas (
+    message_id  INTEGER PRIMARY KEY,
+    guild_id    INTEGER,
+    channel_id  INTEGER NOT NULL,
+    author_id   INTEGER NOT NULL,
+    tag         TEXT NOT NULL,
+    protiv      TEXT NOT NULL,
+    biz         TEXT,
+    vremya      TEXT NOT NULL,
+    lokaciya    TEXT NOT NULL,
+    oruzhie     TEXT NOT NULL,
+    ping_to     TEXT NOT NULL DEFAULT '',
+    target_ts   REAL NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'pending',
+    accepted_by INTEGER,
+    accepted_at REAL,
+    rejected_by INTEGER,
+    rejected_at REAL,
+    size        TEXT,
+    created_at  REAL NOT NULL,
+    is_open     INTEGER NOT NULL DEFAULT 1
+);
+
+-- частичный индекс: при старте читаем только открытые стрелы
+CREATE INDEX IF NOT EXISTS strelas_open ON strelas(target_ts) WHERE is_open = 1;
+CREATE INDEX IF NOT EXISTS strelas_target ON strelas(target_ts);
+
+-- служебные значения (хеш синхронизированного дерева команд и т.п.)
+CREATE TABLE IF NOT EXISTS meta (
+    key    TEXT PRIMARY KEY,
+    value  TEXT NOT NULL
+);
+
+-- закреплённая сводка стрел в канале (режим доски)
+CREATE TABLE IF NOT EXISTS boards (
+    channel_id  INTEGER PRIMARY KEY,
+    message_id  INTEGER NOT NULL
+);
+
+-- ЛС получателей: id DM-канала и отметка, что ЛС закрыты
+CREATE TABLE IF NOT EXISTS dm_recipients (
+    user_id     INTEGER PRIMARY KEY,
+    channel_id  INTEGER,
+    closed_at   REAL
+);
+
+-- журнал переходов стрел: created / accepted / rejected / rolled_back / started
+CREATE TABLE IF NOT EXISTS events (
+    id          INTEGER PRIMARY KEY,
+    message_id  INTEGER NOT NULL,
+    guild_id    INTEGER NOT NULL,
+    kind        TEXT NOT NULL,
+    at          REAL NOT NULL,
+    user_id     INTEGER,
+    size        TEXT
+);
+CREATE INDEX IF NOT EXISTS events_strela ON events(message_id);
+
+-- готовые суммы по дням (МСК): статистика читается отсюда, а не из журнала
+CREATE TABLE IF NOT EXISTS stats_daily (
+    guild_id     INTEGER NOT NULL,
+    day          TEXT NOT NULL,
+    faction      TEXT NOT NULL,
+    biz          TEXT NOT NULL,
+    opened       INTEGER NOT NULL DEFAULT 0,
+    accepted     INTEGER NOT NULL DEFAULT 0,
+    rejected     INTEGER NOT NULL DEFAULT 0,
+    rolled_back  INTEGER NOT NULL DEFAULT 0,
+    started      INTEGER NOT NULL DEFAULT 0,
+    size_sum     INTEGER NOT NULL DEFAULT 0,
+    size_n       INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, day, faction, biz)
+) WITHOUT ROWID;
+
+-- сообщения, которые надо удалить в срок; переживает рестарт, в отличие от delete_after
+CREATE TABLE IF NOT EXISTS pending_deletes (
+    message_id  INTEGER PRIMARY KEY,
+    channel_id  INTEGER NOT NULL,
+    delete_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pending_deletes_due ON pending_deletes(delete_at);
+
+-- шина между процессами (STRELA_PROCESS=gateway -> worker.py): читается по возрастанию id
+CREATE TABLE IF NOT EXISTS bus (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind        TEXT NOT NULL,
+    payload     TEXT NOT NULL,
+    created_at  REAL NOT NULL
+);
+"""
+
+STRELA_COLUMNS = {
+    "guild_id", "channel_id", "author_id", "tag", "protiv", "biz", "vremya",
+    "lokaciya", "oruzhie", "ping_to", "target_ts", "status", "accepted_by",
+    "accepted_at", "rejected_by", "rejected_at", "size", "is_open", "archived_at",
+}
+
+STATS_COLUMNS = ("opened", "accepted", "rejected", "rolled_back", "started", "size_sum", "size_n")
+STATS_GROUPS = {"faction", "biz"}
+
+# колонки, добавленные позже: докидываем их в уже существующую базу
+ADDED_COLUMNS = {
+    "strelas": [("accepted_at", "REAL"), ("rejected_at", "REAL"), ("archived_at", "REAL")],
+}
+
+# индексы по добавленным колонкам — создаются после миграции
+ADDED_INDEXES = [
+    # закрытые, но ещё не убранные из канала стрелы
+    "CREATE INDEX IF NOT EXISTS strelas_unarchived ON strelas(target_ts) "
+    "WHERE is_open = 0 AND archived_at IS NULL",
+]
+
+
+class StrelaStore:
+    """
+    Локальное хранилище стрел (SQLite в режиме WAL).
+    Ключ — id сообщения стрелы. Переживает рестарт воркера.
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        # autocommit: каждая запись — отдельная короткая транзакция
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        for table, columns in ADDED_COLUMNS.items():
+            have = {r["name"] for r in self.db.execute(f"PRAGMA table_info({table})")}
+            for name, decl in columns:
+                if name not in have:
+                    self.db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+        for sql in ADDED_INDEXES:
+            self.db.execute(sql)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # в autocommit-режиме несколько записей склеиваем явной транзакцией;
+        # вложенная (например, log_event внутри пакета) — точка сохранения во внешней
+        if self.db.in_transaction:
+            self.db.execute("SAVEPOINT nested")
+            try:
+                yield
+            except BaseException:
+                self.db.execute("ROLLBACK TO nested")
+                self.db.execute("RELEASE nested")
+                raise
+            self.db.execute("RELEASE nested")
+            return
+
+        self.db.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def add(self, message_id: int, **fields):
+        fields.setdefault("created_at", time.time())
+        cols = ["message_id", *fields]
+        self.db.execute(
+            f"INSERT OR REPLACE INTO strelas ({', '.join(cols)}) "
+            f"VALUES ({', '.join('?' for _ in cols)})",
+            (message_id, *fields.values()),
+        )
+
+    def update(self, message_id: int, **fields):
+        unknown = set(fields) - STRELA_COLUMNS
+        if unknown:
+            raise ValueError(f"Неизвестные поля стрелы: {', '.join(sorted(unknown))}")
+
+        sets = ", ".join(f"{k} = ?" for k in fields)
+        self.db.execute(
+            f"UPDATE strelas SET {sets} WHERE message_id = ?",
+            (*fields.values(), message_id),
+        )
+
+    def close(self, message_id: int):
+        self.update(message_id, is_open=0)
+
+    def get(self, message_id: int) -> sqlite3.Row | None:
+        return self.db.execute(
+            "SELECT * FROM strelas WHERE message_id = ?", (message_id,)
+        ).fetchone()
+
+    def load_open(self) -> list[sqlite3.Row]:
+        # один запрос по частичному индексу strelas_open
+        return self.db.execute(
+            "SELECT * FROM strelas WHERE is_open = 1 ORDER BY target_ts"
+        ).fetchall()
+
+    def load_since(self, since_ts: float) -> list[sqlite3.Row]:
+        # стрелы, начинающиеся не раньше since_ts (открытые и недавно закрытые)
+        return self.db.execute(
+            "SELECT * FROM strelas WHERE target_ts >= ? ORDER BY target_ts", (since_ts,)
+        ).fetchall()
+
+    def load_dm_recipients(self) -> list[sqlite3.Row]:
+        return self.db.execute("SELECT * FROM dm_recipients").fetchall()
+
+    def save_dm_channel(self, user_id: int, channel_id: int):
+        self.db.execute(
+            "INSERT INTO dm_recipients (user_id, channel_id) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET channel_id = excluded.channel_id",
+            (user_id, channel_id),
+        )
+
+    def set_dm_closed(self, user_id: int, closed_at: float | None):
+        self.db.execute(
+            "INSERT INTO dm_recipients (user_id, closed_at) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET closed_at = excluded.closed_at",
+            (user_id, closed_at),
+        )
+
+    def get_board(self, channel_id: int) -> int | None:
+        row = self.db.execute(
+            "SELECT message_id FROM boards WHERE channel_id = ?", (channel_id,)
+        ).fetchone()
+        return row["message_id"] if row else None
+
+    def set_board(self, channel_id: int, message_id: int):
+        self.db.execute(
+            "INSERT OR REPLACE INTO boards (channel_id, message_id) VALUES (?, ?)",
+            (channel_id, message_id),
+        )
+
+    def get_meta(self, key: str) -> str | None:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_meta(self, key: str, value: str):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def recent_biz(self, limit: int, guild_id: int) -> list[str]:
+        # последние использованные на сервере бизнесы, от старых к новым
+        rows = self.db.execute(
+            "SELECT biz, MAX(created_at) AS last FROM strelas "
+            "WHERE guild_id = ? AND biz IS NOT NULL AND biz != '' "
+            "GROUP BY biz ORDER BY last DESC LIMIT ?",
+            (guild_id, limit),
+        ).fetchall()
+        return [row["biz"] for row in reversed(rows)]
+
+    def log_event(
+        self,
+        message_id: int,
+        guild_id: int,
+        kind: str,
+        at: float,
+        user_id: int | None = None,
+        size: str | None = None,
+        bumps: list[tuple[str, str, str, dict]] = (),
+    ):
+        # событие и изменения сумм пишутся вместе: суммы всегда сходятся с журналом
+        with self.transaction():
+            self.db.execute(
+                "INSERT INTO events (message_id, guild_id, kind, at, user_id, size) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (message_id, guild_id, kind, at, user_id, size),
+            )
+            for day, faction, biz, deltas in bumps:
+                unknown = set(deltas) - set(STATS_COLUMNS)
+                if unknown:
+                    raise ValueError(f"Неизвестные поля статистики: {', '.join(sorted(unknown))}")
+                cols = ", ".join(deltas)
+                sets = ", ".join(f"{k} = {k} + excluded.{k}" for k in deltas)
+                self.db.execute(
+                    f"INSERT INTO stats_daily (guild_id, day, faction, biz, {cols}) "
+                    f"VALUES (?, ?, ?, ?, {', '.join('?' for _ in deltas)}) "
+                    f"ON CONFLICT(guild_id, day, faction, biz) DO UPDATE SET {sets}",
+                    (guild_id, day, faction, biz, *deltas.values()),
+                )
+
+    def load_stats(self, guild_id: int, since_day: str, group: str) -> list[sqlite3.Row]:
+        # диапазон по первичному ключу (guild_id, day, ...) — журнал не читается
+        if group not in STATS_GROUPS:
+            raise ValueError(f"Неизвестная группировка: {group}")
+        sums = ", ".join(f"SUM({c}) AS {c}" for c in STATS_COLUMNS)
+        return self.db.execute(
+            f"SELECT {group} AS name, {sums} FROM stats_daily "
+            f"WHERE guild_id = ? AND day >= ? GROUP BY {group} "
+            f"ORDER BY opened + accepted + rejected DESC, name",
+            (guild_id, since_day),
+        ).fetchall()
+
+    def load_expired(self, before_ts: float, limit: int) -> list[sqlite3.Row]:
+        # по частичному индексу strelas_unarchived
+        return self.db.execute(
+            "SELECT * FROM strelas "
+            "WHERE is_open = 0 AND archived_at IS NULL AND target_ts < ? "
+            "ORDER BY target_ts LIMIT ?",
+            (before_ts, limit),
+        ).fetchall()
+
+    def archive(self, message_ids: list[int], at: float):
+        self.db.executemany(
+            "UPDATE strelas SET archived_at = ? WHERE message_id = ?",
+            [(at, mid) for mid in message_ids],
+        )
+
+    def schedule_delete(self, channel_id: int, message_id: int, delete_at: float):
+        self.db.execute(
+            "INSERT OR REPLACE INTO pending_deletes (message_id, channel_id, delete_at) VALUES (?, ?, ?)",
+            (message_id, channel_id, delete_at),
+        )
+
+    def due_deletes(self, now: float, limit: int) -> list[sqlite3.Row]:
+        return self.db.execute(
+            "SELECT * FROM pending_deletes WHERE delete_at <= ? ORDER BY delete_at LIMIT ?",
+            (now, limit),
+        ).fetchall()
+
+    def next_delete_at(self) -> float | None:
+        row = self.db.execute("SELECT MIN(delete_at) AS at FROM pending_deletes").fetchone()
+        return row["at"]
+
+    def drop_deletes(self, message_ids: list[int]):
+        self.db.executemany(
+            "DELETE FROM pending_deletes WHERE message_id = ?", [(mid,) for mid in message_ids]
+        )
+
+    # ====== ШИНА МЕЖДУ ПРОЦЕССАМИ ======
+    def bus_put(self, kind: str, payload: dict):
+        self.db.execute(
+            "INSERT INTO bus (kind, payload, created_at) VALUES (?, ?, ?)",
+            (kind, json.dumps(payload), time.time()),
+        )
+
+    def bus_take(self, limit: int) -> list[tuple[str, dict, float]]:
+        # читатель один (воркер): прочитал — удалил; склеивать в транзакцию незачем,
+        # а отложенная транзакция с апгрейдом до записи ловила бы SQLITE_BUSY от шлюза
+        rows = self.db.execute(
+            "SELECT id, kind, payload, created_at FROM bus ORDER BY id LIMIT ?", (limit,)
+        ).fetchall()
+        if rows:
+            self.db.execute("DELETE FROM bus WHERE id <= ?", (rows[-1]["id"],))
+        return [(row["kind"], json.loads(row["payload"]), row["created_at"]) for row in rows]
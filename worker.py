@@ -0,0 +1,129 @@
+"""
+Воркер разделённого запуска: бот с STRELA_PROCESS=gateway держит шлюз и отвечает
+на взаимодействия, а этот процесс без подключения к шлюзу (только REST) ведёт
+отсчёт и уведомления о начале, доски, рассылку ЛС и уборку канала.
+
+    STRELA_PROCESS=gateway python bot.py
+    python worker.py
+
+Общая у них только база (STRELA_DB): стрелы воркер поднимает из неё при старте,
+а о новых стрелах, ответах, ЛС и перечитывании настроек узнаёт из таблицы bus.
+Воркер должен быть один — он единственный владелец таймеров.
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime
+
+# до импорта бота: он читает режим на уровне модуля
+os.environ["STRELA_PROCESS"] = "worker"
+
+import bot as core  # noqa: E402
+from models import MSK, Strela  # noqa: E402
+from runtime import install_event_loop, watch_slow_callbacks  # noqa: E402
+
+BUS_POLL = float(os.getenv("STRELA_BUS_POLL", "0.25"))
+BUS_BATCH = 500
+# ЛС, пролежавшие в шине дольше (воркер был остановлен), уже не актуальны
+DM_BUS_TTL = 600
+
+
+def sync_strela(message_id: int):
+    row = core.store.get(message_id)
+    if row is None or not row["is_open"]:
+        return  # закрыта самим воркером или убрана уборкой
+
+    fresh = Strela.from_row(row)
+    strela = core.strelas.get(message_id)
+    if strela is None:
+        # новая: шлюз уже отправил сообщение в актуальном виде
+        strela = core.strelas[message_id] = fresh
+        strela.shown_key = strela.render_key(datetime.now(MSK))
+    elif fresh.state_fields() != strela.state_fields():
+        # ответ по кнопке: сверяем сообщение сразу — правка таймера, ушедшая до
+        # ответа, могла лечь поверх него со старым статусом
+        strela.restore_state(fresh.state_fields())
+    else:
+        return
+
+    core.start_countdown(strela)
+    core.touch_board(strela.channel_id)
+
+
+def handle(kind: str, payload: dict, created_at: float):
+    if kind == "strela":
+        sync_strela(payload["id"])
+    elif kind == "dm":
+        if time.time() - created_at > DM_BUS_TTL:
+            return
+        core.dm_digest.extend((users, tuple(item)) for users, item in payload["entries"])
+    elif kind == "reload":
+        try:
+            core.config.reload()
+        except ValueError as e:
+            print("CONFIG RELOAD ERROR:", e)
+            return
+        for channel_id in core.config.all_channels():
+            core.touch_board(channel_id)
+    else:
+        print("BUS: неизвестное сообщение", kind)
+
+
+async def drain_bus():
+    while True:
+        try:
+            batch = core.store.bus_take(BUS_BATCH)
+        except Exception as e:
+            # например, база занята шлюзом дольше таймаута — попробуем на следующем круге
+            print("BUS ERROR:", e)
+            core.ERRORS.inc("bus")
+            batch = []
+
+        for kind, payload, created_at in batch:
+            try:
+                handle(kind, payload, created_at)
+            except Exception as e:
+                print("BUS HANDLE ERROR:", kind, e)
+                core.ERRORS.inc("bus")
+
+        if len(batch) < BUS_BATCH:
+            await asyncio.sleep(BUS_POLL)
+
+
+async def run(token: str):
+    # login без connect: HTTP-клиент и состояние есть, шлюза нет
+    await core.bot.login(token)
+    try:
+        core.scheduler.start()
+        core.outbound.start()
+        core.dm_fanout.start()
+
+        try:
+            await core.serve_metrics()
+        except OSError as e:
+            print("METRICS ERROR:", e)
+        core.run_in_background(core.watch_loop_lag())
+        watch_slow_callbacks()
+
+        print(f"Восстановлено стрел: {core.restore_strelas()}")
+        for channel_id in {*core.config.all_channels(), *(s.channel_id for s in core.strelas.values())}:
+            core.touch_board(channel_id)
+        core.wake_compaction(time.time())
+        print(f"Воркер готов за {time.monotonic() - core.STARTED_AT:.2f} с")
+
+        await drain_bus()
+    finally:
+        await core.bot.close()
+
+
+def main():
+    print(f"Цикл событий: {install_event_loop()}")
+    try:
+        asyncio.run(run(os.getenv("TOKEN")))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()